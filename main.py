@@ -1,14 +1,13 @@
-import json
-import urllib.request
-import urllib.parse
-import urllib.error
+import os
 import logging
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional
 
 from ulauncher.api.client.Extension import Extension
 from ulauncher.api.client.EventListener import EventListener
-from ulauncher.api.shared.event import KeywordQueryEvent, ItemEnterEvent
+from ulauncher.api.shared.event import KeywordQueryEvent, ItemEnterEvent, PreferencesEvent, PreferencesUpdateEvent
 from ulauncher.api.shared.item.ExtensionResultItem import ExtensionResultItem
 from ulauncher.api.shared.action.RenderResultListAction import RenderResultListAction
 from ulauncher.api.shared.action.HideWindowAction import HideWindowAction
@@ -18,19 +17,296 @@ from ulauncher.api.shared.action.OpenUrlAction import OpenUrlAction
 from ulauncher.api.shared.action.DoNothingAction import DoNothingAction
 from ulauncher.api.shared.action.CopyToClipboardAction import CopyToClipboardAction
 
+from pinboard_core import PinboardStore
+
+
+class SessionState:
+    """Per-session UI state (selection and current view), guarded by a lock
+
+    Loaded data lives in the store's immutable snapshots, so this is the only
+    mutable state event handlers share. Selected tags are a tuple that is
+    replaced, never modified, so readers always see a complete selection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._selected_tags = ()
+        self._current_view = None  # Pode ser 'main', 'tags', 'recent', 'search', 'add', 'transfer' ou 'duplicates'
+        self._current_tag_filter = ""  # Armazenar o filtro de tags atual
+        self._reset_query_requested = False  # Flag para indicar que queremos resetar a query
+
+    @property
+    def selected_tags(self):
+        return self._selected_tags
+
+    def toggle_tag(self, tag, is_selected):
+        """Deselect tag if is_selected, otherwise select it; returns the new selection"""
+        with self._lock:
+            if is_selected:
+                self._selected_tags = tuple(t for t in self._selected_tags if t != tag)
+            elif tag not in self._selected_tags:
+                self._selected_tags += (tag,)
+            return self._selected_tags
+
+    def clear_tags(self):
+        with self._lock:
+            self._selected_tags = ()
+
+    @property
+    def current_view(self):
+        return self._current_view
+
+    @current_view.setter
+    def current_view(self, view):
+        with self._lock:
+            self._current_view = view
+
+    @property
+    def current_tag_filter(self):
+        return self._current_tag_filter
+
+    @current_tag_filter.setter
+    def current_tag_filter(self, tag_filter):
+        with self._lock:
+            self._current_tag_filter = tag_filter
+
+    def request_query_reset(self):
+        with self._lock:
+            self._reset_query_requested = True
+
+    def take_query_reset_request(self):
+        """Return whether a query reset was requested, clearing the request"""
+        with self._lock:
+            requested = self._reset_query_requested
+            self._reset_query_requested = False
+            return requested
+
+
+VIEW_CACHE_SIZE = 128  # Stage results kept by the view engine
+
+
+class ViewEngine:
+    """Builds the tag and bookmark lists of every view as filter -> rank -> limit -> render
+
+    Each stage result is cached by the inputs it depends on: the store snapshot
+    version (taken after loading, so expired data is refetched and gets a new
+    version), the preferences the stage reads, the tag selection (as a set, since
+    its order does not change the result) and the query. A tag toggle changes
+    the selection every tag stage depends on, so it recomputes them; re-rendering
+    a view, going back to a selection seen before, or typing a tag query over a
+    selection reuses the cached stages. Per-stage hits, misses and time spent
+    are counted in ``stats`` and summarized in the log after each view.
+    """
+
+    def __init__(self, extension):
+        self.extension = extension
+        self.stats = {}  # stage -> [hits, misses, seconds spent computing]
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _stage(self, stage, key, compute, trace):
+        """Return the cached result of stage for key, computing and caching it on a miss
+
+        Results are tuples, so cached values can be shared between renders. The
+        time spent computing, or None on a hit, is appended to trace.
+        """
+        cache_key = (stage,) + key
+        with self._lock:
+            stats = self.stats.setdefault(stage, [0, 0, 0.0])
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                stats[0] += 1
+                trace.append(None)
+                return self._cache[cache_key]
+
+        started = time.perf_counter()
+        result = tuple(compute())
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            stats[1] += 1
+            stats[2] += elapsed
+            self._cache[cache_key] = result
+            while len(self._cache) > VIEW_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        trace.append(elapsed)
+        return result
+
+    def _log_view(self, view, trace):
+        """Log how many stages of a view were cached, and the overall hit rate so far"""
+        computed = [elapsed for elapsed in trace if elapsed is not None]
+        with self._lock:
+            hits = sum(stats[0] for stats in self.stats.values())
+            lookups = hits + sum(stats[1] for stats in self.stats.values())
+        self.extension.logger.info(
+            f"{view}: {len(trace) - len(computed)} of {len(trace)} stages cached, "
+            f"{sum(computed) * 1000:.1f}ms computing ({hits / lookups:.0%} of all stages cached so far)"
+        )
+
+    def _bookmark_item(self, bookmark):
+        return ExtensionResultItem(
+            icon='images/pinboard.png',
+            name=bookmark.get('description', 'No title'),
+            description=bookmark.get('href', 'No URL'),
+            on_enter=ExtensionCustomAction({
+                'action': 'open_bookmark',
+                'url': bookmark.get('href', '')
+            })
+        )
+
+    def _tag_item(self, tag, is_selected):
+        return ExtensionResultItem(
+            icon='images/tag_selected.png' if is_selected else 'images/tag.png',
+            name=f"{tag['name']}",
+            description=f"{tag['count']} bookmarks (Click to {'deselect' if is_selected else 'select'})",
+            on_enter=ExtensionCustomAction({
+                'action': 'toggle_tag',
+                'tag': tag['name'],
+                'is_selected': is_selected
+            }, keep_app_open=True)
+        )
+
+    def tag_items(self, selection=(), tag_query=''):
+        """Result items for the tag browser: selected tags first, then the others up to max_results"""
+        store = self.extension.store
+        preferences = self.extension.preferences
+        sort_preference = preferences.get('sort_tags', 'count')
+        max_results = int(preferences.get('max_results', '50'))
+
+        # Load (or refetch expired) data once, first, so the snapshot version identifies
+        # it; the stages below only read it, so a failing fetch is not retried mid-render
+        tags = store.get_tags()
+        if selection:
+            store.get_bookmarks()
+        snapshot = store.snapshot
+        narrow_key = (snapshot.version, frozenset(selection))
+        filter_key = narrow_key + (tag_query,)
+        rank_key = filter_key + (sort_preference,)
+        trace = []
+
+        def narrow():
+            return store.narrow_tags(tags, selection, snapshot.tag_index)
+
+        def filter_tags():
+            return [tag for tag in narrowed if not tag_query or tag_query in tag['name'].lower()]
+
+        def rank():
+            partitions = ([], [])
+            for tag in filtered:
+                partitions[tag['name'] not in selection].append(tag)
+            for tags in partitions:
+                store.sort_tags(tags)
+            return (tuple(tags) for tags in partitions)
+
+        def render():
+            max_display = max_results - len(selected_tags)  # Ajustar limite considerando tags selecionadas
+            items = [self._tag_item(tag, True) for tag in selected_tags]
+            items.extend(self._tag_item(tag, False) for tag in unselected_tags[:max_display])
+
+            if len(unselected_tags) > max_display:
+                items.append(ExtensionResultItem(
+                    icon='images/tag.png',
+                    name=f"... and {len(unselected_tags) - max_display} more tags",
+                    description="Update max results to see more tags",
+                    on_enter=HideWindowAction()
+                ))
+
+            if not items:
+                error_message = store.error_message
+                items.append(ExtensionResultItem(
+                    icon='images/tag.png',
+                    name='Error loading tags' if error_message else 'No matching tags found',
+                    description=(f'Error: {error_message}. Try again later or check your token.'
+                                 if error_message else 'Try a different search term'),
+                    on_enter=HideWindowAction()
+                ))
+            return items
+
+        narrowed = self._stage('tags.narrow', narrow_key, narrow, trace)
+        filtered = self._stage('tags.filter', filter_key, filter_tags, trace)
+        selected_tags, unselected_tags = self._stage('tags.rank', rank_key, rank, trace)
+        items = self._stage('tags.render', rank_key + (max_results,), render, trace)
+        self._log_view('Tag list', trace)
+        return items
+
+    def bookmark_items(self, query='', selection=(), recent=False):
+        """Result items for bookmarks matching query, from all bookmarks (within the
+        selected tags, if any) or from the recent ones, limited to max_results"""
+        store = self.extension.store
+        preferences = self.extension.preferences
+        sort_preference = preferences.get('sort_bookmarks', 'time')
+        max_results = int(preferences.get('max_results', '50'))
+        recent_count = int(preferences.get('recent_count', '20')) if recent else None
+        # Frecency rankings change with every open; the other orders only with the data
+        usage_version = store.usage_log.version if sort_preference == 'frecency' else None
+
+        # Load (or refetch expired) data once, first, so the snapshot version identifies
+        # it; the stages below only read it, so a failing fetch is not retried mid-render
+        if recent:
+            bookmarks = store.get_recent_bookmarks(recent_count)
+        else:
+            bookmarks = store.get_bookmarks()  # Tag filters run on the tag index built from it
+        snapshot = store.snapshot
+        key = (snapshot.version, recent_count, frozenset(selection), query)
+        trace = []
+
+        def filter_bookmarks():
+            if recent:
+                return store.select_bookmarks(bookmarks, query)
+            return store.select_bookmarks(bookmarks, query, selection, snapshot.tag_index)
+
+        def rank():
+            bookmarks = list(filtered)
+            store.rank_bookmarks(bookmarks)
+            return bookmarks
+
+        def limit():
+            return ranked[:max_results]
+
+        def render():
+            items = [self._bookmark_item(bookmark) for bookmark in limited]
+
+            if len(ranked) > max_results:
+                items.append(ExtensionResultItem(
+                    icon='images/info.png',
+                    name='...and more results',
+                    description=f'Your search returned more than {max_results} results',
+                    on_enter=HideWindowAction()
+                ))
+
+            if not items:
+                error_message = store.error_message
+                kind = 'recent bookmarks' if recent else 'bookmarks'
+                if error_message:
+                    name, description = f'Error loading {kind}', f'Error: {error_message}'
+                elif recent and not query:
+                    name, description = 'No recent bookmarks found', 'Try again later or add some bookmarks'
+                else:
+                    name, description = f'No matching {kind} found', 'Try a different search term'
+                items.append(ExtensionResultItem(
+                    icon='images/pinboard.png',
+                    name=name,
+                    description=description,
+                    on_enter=HideWindowAction()
+                ))
+            return items
+
+        filtered = self._stage('bookmarks.filter', key, filter_bookmarks, trace)
+        ranked = self._stage('bookmarks.rank', key + (sort_preference, usage_version), rank, trace)
+        limited = self._stage('bookmarks.limit', key + (sort_preference, usage_version, max_results), limit, trace)
+        items = self._stage('bookmarks.render', key + (sort_preference, usage_version, max_results), render, trace)
+        self._log_view('Recent list' if recent else 'Bookmark list', trace)
+        return items
+
 
 class PinboardExtension(Extension):
     def __init__(self):
         super().__init__()
         self.subscribe(KeywordQueryEvent, KeywordQueryEventListener())
         self.subscribe(ItemEnterEvent, ItemEnterEventListener())
-        self.selected_tags = []
-        self.cache = {}
-        self.last_cache_time = None
-        self.error_message = None
-        self.current_view = None  # Pode ser 'main', 'tags', 'recent', ou 'search'
-        self.current_tag_filter = ""  # Armazenar o filtro de tags atual
-        self.reset_query_requested = False  # Nova flag para indicar que queremos resetar a query
+        self.subscribe(PreferencesEvent, PreferencesEventListener())
+        self.subscribe(PreferencesUpdateEvent, PreferencesUpdateEventListener())
+        self.session = SessionState()
         
         # Setup logger
         self.logger = logging.getLogger(__name__)
@@ -41,157 +317,36 @@ class PinboardExtension(Extension):
             handler.setFormatter(formatter)
             self.logger.addHandler(handler)
 
+        # Data layer shared with the command line tool; it reads the same preferences dict
+        self.store = PinboardStore(self.preferences, logger=self.logger)
+        self.views = ViewEngine(self)
+
     def get_token(self):
-        return self.preferences.get('pinboard_token', '')
+        return self.store.get_token()
 
-    def get_bookmarks(self, tag=''):
-        """Get bookmarks from Pinboard API"""
-        if not self.get_token():
-            return []
-            
-        # Use cache if available and not expired
-        cache_key = f'bookmarks_{tag}'
-        current_time = datetime.now()
-        cache_time_minutes = int(self.preferences.get('cache_time', '5'))
-        cache_time_seconds = cache_time_minutes * 60
-        
-        if (self.last_cache_time and 
-            (current_time - self.last_cache_time).total_seconds() < cache_time_seconds and
-            cache_key in self.cache):
-            return self.cache[cache_key]
-            
-        # Not in cache, fetch from API
-        self.logger.info(f"Cache miss for bookmarks, tag: {tag or 'all'}")
-        url = f'https://api.pinboard.in/v1/posts/all?auth_token={self.get_token()}&format=json'
-        if tag:
-            url += f'&tag={urllib.parse.quote(tag)}'
-            
-        try:
-            with urllib.request.urlopen(url, timeout=10) as response:
-                bookmarks = json.loads(response.read())
-                self.cache[cache_key] = bookmarks
-                self.last_cache_time = current_time
-                self.error_message = None
-                return bookmarks
-        except Exception as e:
-            self.error_message = str(e)
-            return []
-
-    def get_recent_bookmarks(self, count=None):
-        """Get recent bookmarks from Pinboard API"""
-        if not self.get_token():
-            return []
-        
-        # Use the count parameter if provided, otherwise get from preferences
-        if count is None:
-            count = int(self.preferences.get('recent_count', '20'))
-            
-        self.logger.info(f"Fetching {count} recent bookmarks")
-            
-        # Use cache if available and not expired
-        cache_key = f'recent_bookmarks_{count}'
-        current_time = datetime.now()
-        cache_time_minutes = int(self.preferences.get('cache_time', '5'))
-        cache_time_seconds = cache_time_minutes * 60
-        
-        if (self.last_cache_time and 
-            (current_time - self.last_cache_time).total_seconds() < cache_time_seconds and
-            cache_key in self.cache):
-            return self.cache[cache_key]
-            
-        # Not in cache, fetch from API
-        self.logger.info(f"Cache miss for recent bookmarks, count: {count}")
-        url = f'https://api.pinboard.in/v1/posts/recent?auth_token={self.get_token()}&format=json&count={count}'
-            
-        try:
-            with urllib.request.urlopen(url, timeout=10) as response:
-                data = json.loads(response.read())
-                bookmarks = data.get('posts', [])
-                self.cache[cache_key] = bookmarks
-                self.last_cache_time = current_time
-                self.error_message = None
-                return bookmarks
-        except Exception as e:
-            self.error_message = str(e)
-            return []
-
-    def get_tags(self):
-        """Get tags from Pinboard API"""
-        if not self.get_token():
-            return []
-            
-        # Use cache if available and not expired
-        cache_key = 'tags'
-        current_time = datetime.now()
-        cache_time_minutes = int(self.preferences.get('cache_time', '5'))
-        cache_time_seconds = cache_time_minutes * 60
-        
-        if (self.last_cache_time and 
-            (current_time - self.last_cache_time).total_seconds() < cache_time_seconds and
-            cache_key in self.cache):
-            return self.cache[cache_key]
-            
-        # Not in cache, fetch from API
-        self.logger.info("Cache miss for tags")
-        url = f'https://api.pinboard.in/v1/tags/get?auth_token={self.get_token()}&format=json'
-            
-        try:
-            with urllib.request.urlopen(url, timeout=10) as response:
-                tags_data = json.loads(response.read())
-                tags = [{'name': tag, 'count': count} for tag, count in tags_data.items()]
-                
-                # Sort tags based on user preference
-                sort_preference = self.preferences.get('sort_tags', 'count')
-                self.logger.info(f"Sorting tags by: {sort_preference}")
-                
-                if sort_preference == 'alpha':
-                    tags.sort(key=lambda x: x['name'].lower())
-                else:  # default: sort by count
-                    tags.sort(key=lambda x: x['count'], reverse=True)
-                
-                self.cache[cache_key] = tags
-                self.last_cache_time = current_time
-                self.error_message = None
-                return tags
-        except Exception as e:
-            self.error_message = str(e)
-            return []
-
-    def add_bookmark(self, url, title, description='', tags=None):
-        if not self.get_token() or not url:
-            return False
-
-        tags_str = ','.join(tags) if tags else ''
-        params = {
-            'auth_token': self.get_token(),
-            'url': url,
-            'description': title,
-            'extended': description,
-            'tags': tags_str,
-            'replace': 'yes',
-            'shared': 'no'
-        }
-
-        self.logger.info(f"Adding bookmark: {title} ({url})")
-        query_string = urllib.parse.urlencode(params)
-        api_url = f'https://api.pinboard.in/v1/posts/add?{query_string}'
-
-        try:
-            with urllib.request.urlopen(api_url, timeout=10) as response:
-                result = json.loads(response.read())
-                self.cache = {}  # Reset cache
-                self.last_cache_time = None
-                self.error_message = None
-                return result.get('result_code') == 'done'
-        except Exception as e:
-            self.error_message = str(e)
-            return False
+
+class PreferencesEventListener(EventListener):
+    def on_event(self, event, extension):
+        # Preferences are loaded when the extension starts: fetch every view's data up front
+        extension.store.warm_up()
+
+
+class PreferencesUpdateEventListener(EventListener):
+    def on_event(self, event, extension):
+        if event.id == 'pinboard_token':
+            # Cached data and any running import belong to the previous account
+            if extension.store.import_job:
+                extension.store.import_job.stop()
+            extension.session.clear_tags()
+            extension.store.reset()
+            extension.store.warm_up()
 
 
 class KeywordQueryEventListener(EventListener):
     def on_event(self, event, extension):
         query = event.get_argument() or ""
         items = []
+        selection = extension.session.selected_tags  # One consistent selection for the whole render
 
         if not extension.get_token():
             return RenderResultListAction([
@@ -205,12 +360,12 @@ class KeywordQueryEventListener(EventListener):
 
         # Main menu (if no further input)
         if not query:
-            extension.current_view = 'main'
+            extension.session.current_view = 'main'
             
             # Search bookmarks item
             search_description = "Search all bookmarks"
-            if extension.selected_tags:
-                search_description = f"Search bookmarks with tags: {', '.join(extension.selected_tags)}"
+            if selection:
+                search_description = f"Search bookmarks with tags: {', '.join(selection)}"
             
             items.append(ExtensionResultItem(
                 icon='images/search.png',
@@ -218,16 +373,16 @@ class KeywordQueryEventListener(EventListener):
                 description=search_description,
                 on_enter=ExtensionCustomAction({
                     'action': 'search_bookmarks',
-                    'tags': extension.selected_tags
+                    'tags': list(selection)
                 }, keep_app_open=True)
             ))
 
                      # Clear selected tags item (se houver tags selecionadas)
-            if extension.selected_tags:
+            if selection:
                 items.append(ExtensionResultItem(
                     icon='images/clear.png',
                     name='Clear Selected Tags',
-                    description=f"Currently selected: {', '.join(extension.selected_tags)}",
+                    description=f"Currently selected: {', '.join(selection)}",
                     on_enter=ExtensionCustomAction({
                         'action': 'clear_tags'
                     }, keep_app_open=True)
@@ -258,199 +413,202 @@ class KeywordQueryEventListener(EventListener):
             items.append(ExtensionResultItem(
                 icon='images/plus.png',
                 name='Add New Bookmark',
-                description='Save current URL to Pinboard',
+                description='Save a URL to Pinboard',
                 on_enter=ExtensionCustomAction({
                     'action': 'add_bookmark'
                 }, keep_app_open=True)
             ))
+
+            # Import / export item
+            items.append(ExtensionResultItem(
+                icon='images/pinboard.png',
+                name='Import / Export Bookmarks',
+                description=(extension.store.import_job.status() if extension.store.import_job
+                             else 'Import a browser or Pinboard export, or export your bookmarks'),
+                on_enter=SetUserQueryAction(f"{extension.preferences['pinboard_kw']} !")
+            ))
+
+            # Find duplicates item
+            items.append(ExtensionResultItem(
+                icon='images/info.png',
+                name='Find Duplicate Bookmarks',
+                description='List bookmarks saved more than once under the same URL',
+                on_enter=ExtensionCustomAction({
+                    'action': 'find_duplicates'
+                }, keep_app_open=True)
+            ))
    
             return RenderResultListAction(items)
         
         # Handle tag browsing with # prefix
         if query.startswith("#"):
-            extension.current_view = 'tags'
-            tags = extension.get_tags()
+            extension.session.current_view = 'tags'
             
             # Se há uma solicitação para resetar a query, faça isso e resete a flag
-            if extension.reset_query_requested and query != "#":
-                extension.reset_query_requested = False
+            if query != "#" and extension.session.take_query_reset_request():
                 return SetUserQueryAction(f"{extension.preferences['pinboard_kw']} #")
             
             # Filter tags by query
             tag_query = query[1:].lower().strip()
-            extension.current_tag_filter = tag_query  # Salvar o filtro atual
-            filtered_tags = tags
-            
-            if tag_query:
-                filtered_tags = [tag for tag in tags if tag_query in tag['name'].lower()]
-            
-            # Sort filtered tags based on user preference
-            sort_preference = extension.preferences.get('sort_tags', 'count')
-            extension.logger.info(f"Sorting filtered tags by: {sort_preference}")
-            
-            if sort_preference == 'alpha':
-                filtered_tags.sort(key=lambda x: x['name'].lower())
-            else:  # default: sort by count
-                filtered_tags.sort(key=lambda x: x['count'], reverse=True)
+            extension.session.current_tag_filter = tag_query  # Salvar o filtro atual
             
             # Add a back to menu item 
-            items.insert(0, ExtensionResultItem(
+            items.append(ExtensionResultItem(
                 icon='images/back.png',
                 name='Back to Menu',
                 description='Return to the main menu',
                 on_enter=SetUserQueryAction(extension.preferences['pinboard_kw'])
             ))
             
-            # Separar tags selecionadas e não selecionadas
-            selected_tags = []
-            unselected_tags = []
-            
-            for tag in filtered_tags:
-                if tag['name'] in extension.selected_tags:
-                    selected_tags.append(tag)
-                else:
-                    unselected_tags.append(tag)
-            
-            # Sort selected and unselected tags based on user preference
-            sort_preference = extension.preferences.get('sort_tags', 'count')
-            extension.logger.info(f"Sorting selected and unselected tags by: {sort_preference}")
-            
-            if sort_preference == 'alpha':
-                selected_tags.sort(key=lambda x: x['name'].lower())
-                unselected_tags.sort(key=lambda x: x['name'].lower())
-            else:  # default: sort by count
-                selected_tags.sort(key=lambda x: x['count'], reverse=True)
-                unselected_tags.sort(key=lambda x: x['count'], reverse=True)
-            
             # Add a search with tags item if tags are selected
-            if extension.selected_tags:
+            if selection:
                 
                 # Adicionar opção para limpar todas as tags selecionadas
-                items.insert(1, ExtensionResultItem(
+                items.append(ExtensionResultItem(
                     icon='images/clear.png',
                     name='Clear All Selected Tags',
-                    description=f"Currently selected: {', '.join(extension.selected_tags)}",
+                    description=f"Currently selected: {', '.join(selection)}",
                     on_enter=ExtensionCustomAction({
                         'action': 'clear_tags'
                     }, keep_app_open=True)
                 ))
             
-            # Exibir tags selecionadas primeiro
-            for tag in selected_tags:
-                action_data = {
-                    'action': 'toggle_tag',
-                    'tag': tag['name'],
-                    'is_selected': True
-                }
-                
+            # Exibir tags selecionadas primeiro, depois as não selecionadas
+            items.extend(extension.views.tag_items(selection, tag_query))
+            return RenderResultListAction(items)
+            
+        # Handle adding a bookmark with + prefix: +<url> [title] [#tag ...]
+        if query.startswith("+"):
+            extension.session.current_view = 'add'
+            items.append(ExtensionResultItem(
+                icon='images/back.png',
+                name='Back to Menu',
+                description='Return to the main menu',
+                on_enter=SetUserQueryAction(extension.preferences['pinboard_kw'])
+            ))
+
+            words = query[1:].split()
+            if not words:
+                items.insert(0, ExtensionResultItem(
+                    icon='images/plus.png',
+                    name='Add New Bookmark',
+                    description='Type the URL, optionally followed by a title and #tags',
+                    on_enter=DoNothingAction()
+                ))
+                return RenderResultListAction(items)
+
+            url = words[0] if '://' in words[0] else f'https://{words[0]}'
+            tags = [word[1:] for word in words[1:] if word.startswith('#') and len(word) > 1]
+            title = ' '.join(word for word in words[1:] if not word.startswith('#')) or url
+
+            # Existing bookmarks for this URL come first so they are not saved twice by accident
+            saved = extension.store.find_saved_bookmarks(url)
+            for bookmark in saved:
+                saved_tags = bookmark.get('tags', '')
                 items.append(ExtensionResultItem(
-                    icon='images/tag_selected.png',
-                    name=f"{tag['name']}",
-                    description=f"{tag['count']} bookmarks (Click to deselect)",
-                    on_enter=ExtensionCustomAction(action_data, keep_app_open=True)
+                    icon='images/info.png',
+                    name=f"Already saved as: {bookmark.get('description', 'No title')}",
+                    description=f"Tags: {saved_tags} | {bookmark.get('href', '')}" if saved_tags else bookmark.get('href', ''),
+                    on_enter=ExtensionCustomAction({
+                        'action': 'open_bookmark',
+                        'url': bookmark.get('href', '')
+                    })
                 ))
-            
-            # Depois exibir tags não selecionadas
-            # Limit the number of results
-            max_results = int(extension.preferences.get('max_results', '50'))
-            max_display = max_results - len(selected_tags)  # Ajustar limite considerando tags selecionadas
-            count_total = len(unselected_tags)
-            
-            for tag in unselected_tags[:max_display]:
-                action_data = {
-                    'action': 'toggle_tag',
-                    'tag': tag['name'],
-                    'is_selected': False
-                }
-                
+
+            # Saving the exact same URL overwrites that bookmark, so say so and keep its notes
+            replace = any(bookmark.get('href') == url for bookmark in saved)
+            description = f"{url} {' '.join('#' + tag for tag in tags)}".strip()
+            if replace:
+                name, description = f"Replace existing: {title}", f"{description} (keeps its notes)"
+            else:
+                name = f"Save anyway: {title}" if saved else f"Save {title}"
+            items.append(ExtensionResultItem(
+                icon='images/plus.png',
+                name=name,
+                description=description,
+                on_enter=ExtensionCustomAction({
+                    'action': 'save_bookmark',
+                    'url': url,
+                    'title': title,
+                    'tags': tags,
+                    'replace': replace
+                }, keep_app_open=True)
+            ))
+
+            return RenderResultListAction(items)
+
+        # Handle bulk import and export with ! prefix: !import <file> or !export <file>
+        if query.startswith("!"):
+            extension.session.current_view = 'transfer'
+            command, _, path = query[1:].strip().partition(' ')
+            path = path.strip()
+            job = extension.store.import_job
+
+            if job:
                 items.append(ExtensionResultItem(
-                    icon='images/tag.png',
-                    name=f"{tag['name']}",
-                    description=f"{tag['count']} bookmarks (Click to select)",
-                    on_enter=ExtensionCustomAction(action_data, keep_app_open=True)
+                    icon='images/info.png',
+                    name='Import in progress' if job.is_alive() else 'Last import',
+                    description=f"Error: {job.error_message}" if job.error_message else job.status(),
+                    on_enter=DoNothingAction()
                 ))
-            
-            if count_total > max_display:
+                if job.is_alive():
+                    items.append(ExtensionResultItem(
+                        icon='images/clear.png',
+                        name='Stop Import',
+                        description='Stop after the current bookmark; importing the same file again resumes',
+                        on_enter=ExtensionCustomAction({
+                            'action': 'stop_import'
+                        }, keep_app_open=True)
+                    ))
+
+            if command == 'import' and path:
                 items.append(ExtensionResultItem(
-                    icon='images/tag.png',
-                    name=f"... and {count_total - max_display} more tags",
-                    description="Update max results to see more tags",
-                    on_enter=HideWindowAction()
+                    icon='images/plus.png',
+                    name=f"Import bookmarks from {os.path.basename(path)}",
+                    description=f"{path} (Netscape HTML or JSON; already saved URLs are skipped)",
+                    on_enter=ExtensionCustomAction({
+                        'action': 'import_bookmarks',
+                        'path': path
+                    }, keep_app_open=True)
                 ))
-            
-            if len(items) <= 2:  # Apenas os itens de view e back
+            elif command == 'export' and path:
                 items.append(ExtensionResultItem(
-                    icon='images/tag.png',
-                    name='No matching tags found',
-                    description='Try a different search term',
-                    on_enter=HideWindowAction()
+                    icon='images/pinboard.png',
+                    name=f"Export bookmarks to {os.path.basename(path)}",
+                    description=f"{path} (Netscape HTML for .html files, JSON otherwise)",
+                    on_enter=ExtensionCustomAction({
+                        'action': 'export_bookmarks',
+                        'path': path
+                    }, keep_app_open=True)
+                ))
+            else:
+                items.append(ExtensionResultItem(
+                    icon='images/plus.png',
+                    name='Import Bookmarks',
+                    description='Type !import followed by the path of a bookmark file',
+                    on_enter=SetUserQueryAction(f"{extension.preferences['pinboard_kw']} !import ")
                 ))
-            
-            return RenderResultListAction(items)
-            
-        # Check if we're in the Recent Bookmarks view
-        if extension.current_view == 'recent':
-
-            # Browse only recent bookmarks
-            recent_count = int(extension.preferences.get('recent_count', '20'))
-            extension.logger.info(f"Displaying {recent_count} recent bookmarks")
-            recent_bookmarks = extension.get_recent_bookmarks(recent_count)
-            
-            # Filter recent bookmarks by query
-            filtered_bookmarks = [b for b in recent_bookmarks if 
-                        query.lower() in b.get('description', '').lower() or
-                        query.lower() in b.get('extended', '').lower() or
-                        query.lower() in b.get('href', '').lower()]
-            
-            # Sort bookmarks based on user preference
-            sort_preference = extension.preferences.get('sort_bookmarks', 'time')
-            extension.logger.info(f"Sorting filtered recent bookmarks by: {sort_preference}")
-            
-            if sort_preference == 'title':
-                filtered_bookmarks.sort(key=lambda x: x.get('description', '').lower())
-            else:  # default: sort by time
-                filtered_bookmarks.sort(key=lambda x: x.get('time', ''), reverse=True)
-            
-            # Create result items
-            for bookmark in filtered_bookmarks:
                 items.append(ExtensionResultItem(
                     icon='images/pinboard.png',
-                    name=bookmark.get('description', 'No title'),
-                    description=bookmark.get('href', 'No URL'),
-                    on_enter=OpenUrlAction(bookmark.get('href', ''))
+                    name='Export Bookmarks',
+                    description='Type !export followed by the path of the file to write',
+                    on_enter=SetUserQueryAction(f"{extension.preferences['pinboard_kw']} !export ")
                 ))
-                
-                # Limit number of results
-                max_results = int(extension.preferences.get('max_results', '50'))
-                if len(items) - 2 >= max_results:  # -2 para considerar os itens de cabeçalho
-                    items.append(ExtensionResultItem(
-                        icon='images/info.png',
-                        name=f'...and more results',
-                        description=f'Your search returned more than {max_results} results',
-                        on_enter=HideWindowAction()
-                    ))
-                    break
-            
-            if len(items) <= 2:  # Apenas os itens de view e back
-                # Check if there was an error
-                if extension.error_message:
-                    error_item = ExtensionResultItem(
-                        icon='images/pinboard.png',
-                        name='Error loading recent bookmarks',
-                        description=f'Error: {extension.error_message}',
-                        on_enter=HideWindowAction()
-                    )
-                    items.append(error_item)
-                else:
-                    items.append(ExtensionResultItem(
-                        icon='images/pinboard.png',
-                        name='No matching recent bookmarks found',
-                        description='Try a different search term',
-                        on_enter=HideWindowAction()
-                    ))
+
+            items.append(ExtensionResultItem(
+                icon='images/back.png',
+                name='Back to Menu',
+                description='Return to the main menu',
+                on_enter=SetUserQueryAction(extension.preferences['pinboard_kw'])
+            ))
+
+            return RenderResultListAction(items)
+
+        # Check if we're in the Recent Bookmarks view
+        if extension.session.current_view == 'recent':
             
             # Adicionar o item representativo da view atual como primeiro item
-            items.insert(0, ExtensionResultItem(
+            items.append(ExtensionResultItem(
                 icon='images/info.png',
                 name='Browsing Recent Bookmarks',
                 description=f"{'Currently viewing all recent bookmarks' if not query else f'Filtering recent bookmarks: {query}'}",
@@ -458,22 +616,24 @@ class KeywordQueryEventListener(EventListener):
             ))
             
             # Add a back to menu item
-            items.insert(1, ExtensionResultItem(
+            items.append(ExtensionResultItem(
                 icon='images/back.png',
                 name='Back to Menu',
                 description='Return to the main menu',
                 on_enter=SetUserQueryAction(extension.preferences['pinboard_kw'])
             ))
 
+            # Browse only recent bookmarks, filtered by query
+            items.extend(extension.views.bookmark_items(query, recent=True))
             return RenderResultListAction(items)
         
         # Default: Search bookmarks (normal search mode)
-        extension.current_view = 'search'
+        extension.session.current_view = 'search'
         
         # Adicionar o item representativo da view atual como primeiro item
         search_description = "Search all bookmarks"
-        if extension.selected_tags:
-            search_description = f"Filtering by tags: {', '.join(extension.selected_tags)}"
+        if selection:
+            search_description = f"Filtering by tags: {', '.join(selection)}"
             
         items.append(ExtensionResultItem(
             icon='images/search.png',
@@ -490,72 +650,8 @@ class KeywordQueryEventListener(EventListener):
             on_enter=SetUserQueryAction(extension.preferences['pinboard_kw'])
         ))
         
-        bookmarks = []
-        
-        if extension.selected_tags:
-            # Search in each selected tag's bookmarks
-            for tag in extension.selected_tags:
-                tag_bookmarks = extension.get_bookmarks(tag)
-                for bookmark in tag_bookmarks:
-                    if (query.lower() in bookmark.get('description', '').lower() or 
-                        query.lower() in bookmark.get('extended', '').lower() or
-                        query.lower() in bookmark.get('href', '').lower()):
-                        bookmarks.append(bookmark)
-        else:
-            # Search all bookmarks
-            all_bookmarks = extension.get_bookmarks()
-            bookmarks = [b for b in all_bookmarks if 
-                        query.lower() in b.get('description', '').lower() or
-                        query.lower() in b.get('extended', '').lower() or
-                        query.lower() in b.get('href', '').lower()]
-        
-        # Sort bookmarks based on user preference
-        sort_preference = extension.preferences.get('sort_bookmarks', 'time')
-        extension.logger.info(f"Sorting bookmarks by: {sort_preference}")
-        
-        if sort_preference == 'title':
-            bookmarks.sort(key=lambda x: x.get('description', '').lower())
-        else:  # default: sort by time
-            bookmarks.sort(key=lambda x: x.get('time', ''), reverse=True)
-        
-        # Create result items
-        for bookmark in bookmarks:
-            items.append(ExtensionResultItem(
-                icon='images/pinboard.png',
-                name=bookmark.get('description', 'No title'),
-                description=bookmark.get('href', 'No URL'),
-                on_enter=OpenUrlAction(bookmark.get('href', ''))
-            ))
-            
-            # Limit number of results
-            max_results = int(extension.preferences.get('max_results', '50'))
-            if len(items) - 2 >= max_results:  # -2 para considerar os itens de cabeçalho
-                items.append(ExtensionResultItem(
-                    icon='images/info.png',
-                    name=f'...and more results',
-                    description=f'Your search returned more than {max_results} results',
-                    on_enter=HideWindowAction()
-                ))
-                break
-        
-        if len(items) <= 2:  # Apenas os itens de view e back
-            # Check if there was an error
-            if extension.error_message:
-                error_item = ExtensionResultItem(
-                    icon='images/pinboard.png',
-                    name='Error loading bookmarks',
-                    description=f'Error: {extension.error_message}',
-                    on_enter=HideWindowAction()
-                )
-                items.append(error_item)
-            else:
-                items.append(ExtensionResultItem(
-                    icon='images/pinboard.png',
-                    name='No matching bookmarks found',
-                    description='Try a different search term',
-                    on_enter=HideWindowAction()
-                ))
-        
+        # Search bookmarks (within the selected tags, if any)
+        items.extend(extension.views.bookmark_items(query, selection))
         return RenderResultListAction(items)
 
 
@@ -565,19 +661,24 @@ class ItemEnterEventListener(EventListener):
         action = data.get('action')
         items = []
 
-        if action == 'search_bookmarks':
+        if action == 'open_bookmark':
+            url = data.get('url', '')
+            extension.store.record_open(url)
+            return OpenUrlAction(url)
+
+        elif action == 'search_bookmarks':
             # Set user query to empty to start search
-            extension.current_view = 'search'
+            extension.session.current_view = 'search'
             return SetUserQueryAction(extension.preferences['pinboard_kw'])
         
         elif action == 'browse_tags':
             # Show tag browser
-            extension.current_view = 'tags'
+            extension.session.current_view = 'tags'
             return SetUserQueryAction(f"{extension.preferences['pinboard_kw']} #")
         
         elif action == 'browse_recent':
             # Show recent bookmarks view
-            extension.current_view = 'recent'
+            extension.session.current_view = 'recent'
             
             # Adicionar o item representativo da view atual como primeiro item
             items.append(ExtensionResultItem(
@@ -595,58 +696,8 @@ class ItemEnterEventListener(EventListener):
                 on_enter=SetUserQueryAction(extension.preferences['pinboard_kw'])
             ))
             
-            # Get recent bookmarks
-            recent_count = int(extension.preferences.get('recent_count', '20'))
-            extension.logger.info(f"Displaying {recent_count} recent bookmarks")
-            recent_bookmarks = extension.get_recent_bookmarks(recent_count)
-
-            if not recent_bookmarks and extension.error_message:
-                # Show error
-                items.append(ExtensionResultItem(
-                    icon='images/pinboard.png',
-                    name='Error loading recent bookmarks',
-                    description=f'Error: {extension.error_message}',
-                    on_enter=HideWindowAction()
-                ))
-                return RenderResultListAction(items)
-            
-            # Sort bookmarks based on user preference
-            sort_preference = extension.preferences.get('sort_bookmarks', 'time')
-            extension.logger.info(f"Sorting recent bookmarks by: {sort_preference}")
-            
-            if sort_preference == 'title':
-                recent_bookmarks.sort(key=lambda x: x.get('description', '').lower())
-            else:  # default: sort by time
-                recent_bookmarks.sort(key=lambda x: x.get('time', ''), reverse=True)
-            
             # Create result items for recent bookmarks
-            for bookmark in recent_bookmarks:
-                items.append(ExtensionResultItem(
-                    icon='images/pinboard.png',
-                    name=bookmark.get('description', 'No title'),
-                    description=bookmark.get('href', 'No URL'),
-                    on_enter=OpenUrlAction(bookmark.get('href', ''))
-                ))
-                
-                # Limit number of results
-                max_results = int(extension.preferences.get('max_results', '50'))
-                if len(items) - 2 >= max_results:  # -2 para considerar os itens de cabeçalho
-                    items.append(ExtensionResultItem(
-                        icon='images/info.png',
-                        name=f'...and more results',
-                        description=f'Your search returned more than {max_results} results',
-                        on_enter=HideWindowAction()
-                    ))
-                    break
-            
-            if len(items) <= 2:  # Apenas os itens de view e back
-                items.append(ExtensionResultItem(
-                    icon='images/pinboard.png',
-                    name='No recent bookmarks found',
-                    description='Try again later or add some bookmarks',
-                    on_enter=HideWindowAction()
-                ))
-            
+            items.extend(extension.views.bookmark_items(recent=True))
             return RenderResultListAction(items)
         
         elif action == 'toggle_tag':
@@ -654,132 +705,47 @@ class ItemEnterEventListener(EventListener):
             is_selected = data.get('is_selected')
             
             # Toggle tag selection
-            if is_selected:
-                if tag in extension.selected_tags:
-                    extension.selected_tags.remove(tag)
-            else:
-                if tag not in extension.selected_tags:
-                    extension.selected_tags.append(tag)
+            selection = extension.session.toggle_tag(tag, is_selected)
             
             # Limpar o filtro de tags após selecionar uma tag
-            extension.current_tag_filter = ""
-            
-            # Render the tag browser again
-            tags = extension.get_tags()
-            
-            # Sort tags based on user preference - not needed here as get_tags already returns sorted tags
+            extension.session.current_tag_filter = ""
             
-            # Adicionar o item representativo da view atual como primeiro item
+            # Render the tag browser again, keeping only tags that co-occur with the selection
             tag_items = [
                 ExtensionResultItem(
                     icon='images/back.png',
                     name='Back to Menu',
-                    description=(f"Return to search bookmarks with tags: {', '.join(extension.selected_tags)}" if extension.selected_tags else ""),
+                    description=(f"Return to search bookmarks with tags: {', '.join(selection)}" if selection else ""),
                     on_enter=SetUserQueryAction(extension.preferences['pinboard_kw'])
                 )
             ]
             
             # Add a search with tags item if tags are selected
-            if extension.selected_tags:
+            if selection:
                 
                 # Adicionar opção para limpar todas as tags selecionadas
-                tag_items.insert(1, ExtensionResultItem(
+                tag_items.append(ExtensionResultItem(
                     icon='images/clear.png',
                     name='Clear All Selected Tags',
-                    description=f"Currently selected: {', '.join(extension.selected_tags)}",
+                    description=f"Currently selected: {', '.join(selection)}",
                     on_enter=ExtensionCustomAction({
                         'action': 'clear_tags'
                     }, keep_app_open=True)
                 ))
             
-            if not tags:
-                # No tags found or error occurred
-                error_msg = extension.error_message or "Unknown error"
-                tag_items.append(ExtensionResultItem(
-                    icon='images/tag.png',
-                    name='No tags found',
-                    description=f'Error: {error_msg}. Try again later or check your token.',
-                    on_enter=HideWindowAction()
-                ))
-                return RenderResultListAction(tag_items)
-            
-            # Separar tags selecionadas e não selecionadas
-            selected_tags = []
-            unselected_tags = []
-            
-            for tag_item in tags:
-                if tag_item['name'] in extension.selected_tags:
-                    selected_tags.append(tag_item)
-                else:
-                    unselected_tags.append(tag_item)
-            
-            # Sort selected and unselected tags based on user preference
-            sort_preference = extension.preferences.get('sort_tags', 'count')
-            extension.logger.info(f"Sorting selected and unselected tags by: {sort_preference}")
-            
-            if sort_preference == 'alpha':
-                selected_tags.sort(key=lambda x: x['name'].lower())
-                unselected_tags.sort(key=lambda x: x['name'].lower())
-            else:  # default: sort by count
-                selected_tags.sort(key=lambda x: x['count'], reverse=True)
-                unselected_tags.sort(key=lambda x: x['count'], reverse=True)
-            
-            # Exibir tags selecionadas primeiro
-            for tag_item in selected_tags:
-                action_data = {
-                    'action': 'toggle_tag',
-                    'tag': tag_item['name'],
-                    'is_selected': True
-                }
-                
-                tag_items.append(ExtensionResultItem(
-                    icon='images/tag_selected.png',
-                    name=f"{tag_item['name']}",
-                    description=f"{tag_item['count']} bookmarks (Click to deselect)",
-                    on_enter=ExtensionCustomAction(action_data, keep_app_open=True)
-                ))
-            
-            # Depois exibir tags não selecionadas
-            max_results = int(extension.preferences.get('max_results', '50'))
-            max_display = max_results - len(selected_tags)  # Ajustar limite considerando tags selecionadas
-            count_total = len(unselected_tags)
-            
-            for tag_item in unselected_tags[:max_display]:
-                action_data = {
-                    'action': 'toggle_tag',
-                    'tag': tag_item['name'],
-                    'is_selected': False
-                }
-                
-                tag_items.append(ExtensionResultItem(
-                    icon='images/tag.png',
-                    name=f"{tag_item['name']}",
-                    description=f"{tag_item['count']} bookmarks (Click to select)",
-                    on_enter=ExtensionCustomAction(action_data, keep_app_open=True)
-                ))
-            
-            if count_total > max_display:
-                tag_items.append(ExtensionResultItem(
-                    icon='images/tag.png',
-                    name=f"... and {count_total - max_display} more tags",
-                    description="Update max results to see more tags",
-                    on_enter=HideWindowAction()
-                ))
-            
-            # O primeiro item (ícone de info) já tem a ação SetUserQueryAction para resetar a query para #
+            # Exibir tags selecionadas primeiro, depois as não selecionadas
+            tag_items.extend(extension.views.tag_items(selection))
             return RenderResultListAction(tag_items)
         
         elif action == 'clear_tags':
             # Limpar todas as tags selecionadas
-            extension.selected_tags = []
+            extension.session.clear_tags()
             
             # Limpar o filtro atual
-            extension.current_tag_filter = ""
+            extension.session.current_tag_filter = ""
             
             # Se estamos na view de tags, renderizar diretamente todas as tags
-            if extension.current_view == 'tags':
-                tags = extension.get_tags()
-                
+            if extension.session.current_view == 'tags':
                 # Adicionar o item principal e botão de voltar
                 tag_items = [
                     ExtensionResultItem(
@@ -791,32 +757,7 @@ class ItemEnterEventListener(EventListener):
                 ]
                 
                 # Exibir todas as tags
-                max_results = int(extension.preferences.get('max_results', '50'))
-                max_display = max_results
-                count_total = len(tags)
-                
-                for tag_item in tags[:max_display]:
-                    action_data = {
-                        'action': 'toggle_tag',
-                        'tag': tag_item['name'],
-                        'is_selected': False
-                    }
-                    
-                    tag_items.append(ExtensionResultItem(
-                        icon='images/tag.png',
-                        name=f"{tag_item['name']}",
-                        description=f"{tag_item['count']} bookmarks (Click to select)",
-                        on_enter=ExtensionCustomAction(action_data, keep_app_open=True)
-                    ))
-                
-                if count_total > max_display:
-                    tag_items.append(ExtensionResultItem(
-                        icon='images/tag.png',
-                        name=f"... and {count_total - max_display} more tags",
-                        description="Update max results to see more tags",
-                        on_enter=HideWindowAction()
-                    ))
-                
+                tag_items.extend(extension.views.tag_items())
                 return RenderResultListAction(tag_items)
             else:
                 # Caso esteja na view principal, redirecionar para a view principal
@@ -824,29 +765,142 @@ class ItemEnterEventListener(EventListener):
                 return SetUserQueryAction(extension.preferences['pinboard_kw'])
         
         elif action == 'add_bookmark':
-            # This would normally connect to the active browser to get URL
-            # For this example, we'll just show a placeholder
+            # Switch to the add view, where the URL is typed after the + prefix
+            extension.session.current_view = 'add'
+            return SetUserQueryAction(f"{extension.preferences['pinboard_kw']} +")
+
+        elif action == 'save_bookmark':
+            url = data.get('url', '')
+            title = data.get('title') or url
+            replace = data.get('replace', False)
+
+            # Replacing only updates title and tags; the saved notes are posted back unchanged
+            notes = ''
+            if replace:
+                notes = next((bookmark.get('extended', '') for bookmark in extension.store.find_saved_bookmarks(url)
+                              if bookmark.get('href') == url), '')
+
+            result_code = extension.store.add_bookmark(url, title, notes, data.get('tags'), replace=replace)
+            if result_code == 'done':
+                items.append(ExtensionResultItem(
+                    icon='images/pinboard.png',
+                    name=f"Replaced {title}" if replace else f"Saved {title}",
+                    description=url,
+                    on_enter=HideWindowAction()
+                ))
+            elif result_code == 'item already exists':
+                items.append(ExtensionResultItem(
+                    icon='images/info.png',
+                    name='Already saved',
+                    description=f"{url} is already bookmarked on Pinboard; nothing was changed",
+                    on_enter=HideWindowAction()
+                ))
+            else:
+                items.append(ExtensionResultItem(
+                    icon='images/pinboard.png',
+                    name='Error saving bookmark',
+                    description=f"Error: {extension.store.error_message or 'Pinboard did not accept the bookmark'}",
+                    on_enter=HideWindowAction()
+                ))
+
+            items.append(ExtensionResultItem(
+                icon='images/back.png',
+                name='Back to Menu',
+                description='Return to the main menu',
+                on_enter=SetUserQueryAction(extension.preferences['pinboard_kw'])
+            ))
+
+            return RenderResultListAction(items)
+
+        elif action == 'import_bookmarks':
+            path = os.path.expanduser(data.get('path', ''))
+            if not os.path.isfile(path):
+                return RenderResultListAction([ExtensionResultItem(
+                    icon='images/info.png',
+                    name='File not found',
+                    description=path,
+                    on_enter=SetUserQueryAction(f"{extension.preferences['pinboard_kw']} !import ")
+                )])
+
+            job = extension.store.start_import(path)
+            return RenderResultListAction([ExtensionResultItem(
+                icon='images/info.png',
+                name=f"Importing {os.path.basename(job.path)}",
+                description='Running in the background. Open Import / Export to see the progress',
+                on_enter=SetUserQueryAction(f"{extension.preferences['pinboard_kw']} !")
+            )])
+
+        elif action == 'stop_import':
+            if extension.store.import_job:
+                extension.store.import_job.stop()
+            return SetUserQueryAction(f"{extension.preferences['pinboard_kw']} !")
+
+        elif action == 'export_bookmarks':
+            path = os.path.expanduser(data.get('path', ''))
+            try:
+                count = extension.store.export(path)
+                item = ExtensionResultItem(
+                    icon='images/pinboard.png',
+                    name=f"Exported {count} bookmarks",
+                    description=path,
+                    on_enter=HideWindowAction()
+                )
+            except Exception as e:
+                item = ExtensionResultItem(
+                    icon='images/pinboard.png',
+                    name='Error exporting bookmarks',
+                    description=f'Error: {e}',
+                    on_enter=HideWindowAction()
+                )
+            return RenderResultListAction([item])
+
+        elif action == 'find_duplicates':
+            extension.session.current_view = 'duplicates'
+            groups = extension.store.find_duplicate_bookmarks()
+
             items.append(ExtensionResultItem(
                 icon='images/info.png',
-                name='Adding New Bookmark',
-                description='Currently in add bookmark mode',
+                name='Duplicate Bookmarks',
+                description=f"{len(groups)} URLs saved more than once",
                 on_enter=HideWindowAction()
             ))
-            
+
             items.append(ExtensionResultItem(
                 icon='images/back.png',
                 name='Back to Menu',
                 description='Return to the main menu',
                 on_enter=SetUserQueryAction(extension.preferences['pinboard_kw'])
             ))
-            
-            items.append(ExtensionResultItem(
-                icon='images/pinboard.png',
-                name='Add bookmark feature',
-                description='This would add the current browser URL to Pinboard',
-                on_enter=HideWindowAction()
-            ))
-            
+
+            max_results = int(extension.preferences.get('max_results', '50'))
+            duplicates = [(group, bookmark) for group in groups for bookmark in group]
+            for group, bookmark in duplicates[:max_results]:
+                items.append(ExtensionResultItem(
+                    icon='images/pinboard.png',
+                    name=bookmark.get('description', 'No title'),
+                    description=f"Saved {len(group)} times: {bookmark.get('href', 'No URL')}",
+                    on_enter=ExtensionCustomAction({
+                        'action': 'open_bookmark',
+                        'url': bookmark.get('href', '')
+                    })
+                ))
+
+            if len(duplicates) > max_results:
+                items.append(ExtensionResultItem(
+                    icon='images/info.png',
+                    name='...and more duplicates',
+                    description=f'More than {max_results} duplicate bookmarks found',
+                    on_enter=HideWindowAction()
+                ))
+
+            if len(items) <= 2:
+                items.append(ExtensionResultItem(
+                    icon='images/pinboard.png',
+                    name='Error loading bookmarks' if extension.store.error_message else 'No duplicate bookmarks found',
+                    description=f'Error: {extension.store.error_message}' if extension.store.error_message else 'Every URL is saved only once',
+                    on_enter=HideWindowAction()
+                ))
+
             return RenderResultListAction(items)
         
         return RenderResultListAction([])
@@ -0,0 +1,1369 @@
+"""Pinboard data layer: fetching, caching, indexing and querying bookmarks
+
+Used by the Ulauncher extension in main.py, and runnable on its own as a
+command line tool with JSON output::
+
+    python3 pinboard_core.py search python --tag dev
+    python3 pinboard_core.py tags --selected dev
+    python3 pinboard_core.py recent --count 20
+    python3 pinboard_core.py sync
+    python3 pinboard_core.py stats
+
+The API token is read from --token or the PINBOARD_TOKEN environment variable.
+Pinboard allows posts/all only once every 5 minutes, so the bookmark list is kept
+in DATA_DIR and reused by later runs for --cache-time minutes; ``sync`` refreshes it.
+"""
+import argparse
+import hashlib
+import html
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from types import MappingProxyType
+from typing import NamedTuple, Mapping, Optional
+
+DATA_DIR = os.path.join(
+    os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share')),
+    'ulauncher-pinboard'
+)
+USAGE_LOG_PATH = os.path.join(DATA_DIR, 'usage.log')
+USAGE_HALF_LIFE_DAYS = 30  # An open loses half of its weight after this many days
+USAGE_COMPACT_MIN_LINES = 500  # Never compact logs smaller than this
+USAGE_MIN_SCORE = 0.01  # Entries decayed below this are dropped on compaction
+IMPORT_CHUNK_SIZE = 64 * 1024  # Bookmark files are read in chunks of this many characters
+API_MIN_INTERVAL_SECONDS = 3  # Pinboard asks clients to wait 3 seconds between API calls
+IMPORT_RATE_LIMIT_SECONDS = API_MIN_INTERVAL_SECONDS
+IMPORT_MAX_BACKOFF_SECONDS = 300
+WARMUP_WORKERS = 3  # One per dataset fetched on warm-up
+
+
+class UsageLog:
+    """Append-only log of opened bookmarks with a decayed frecency score per URL
+
+    Each line is ``<timestamp>\\t<weight>\\t<url>``. Scores are kept in memory as
+    ``url -> (score, last_time)`` so ranking costs one lookup per result. When the
+    log grows past twice the number of distinct URLs it is rewritten with a
+    single aggregated line per URL.
+    """
+
+    def __init__(self, path, half_life_days=USAGE_HALF_LIFE_DAYS, logger=None):
+        self.path = path
+        self.half_life = half_life_days * 86400
+        self.logger = logger or logging.getLogger(__name__)
+        self.scores = {}
+        self.line_count = 0
+        self.version = 0  # Bumped on every recorded open, so rankings can be cached
+        self._lock = threading.Lock()  # Serializes writers; score() reads without it
+        self._load()
+
+    def _decay(self, score, since, now):
+        return score * 0.5 ** ((now - since) / self.half_life)
+
+    def _apply(self, url, timestamp, weight):
+        score, last_time = self.scores.get(url, (0.0, timestamp))
+        if timestamp >= last_time:
+            score = self._decay(score, last_time, timestamp) + weight
+            last_time = timestamp
+        else:
+            score += self._decay(weight, timestamp, last_time)
+        self.scores[url] = (score, last_time)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as log_file:
+                for line in log_file:
+                    parts = line.rstrip('\n').split('\t', 2)
+                    if len(parts) != 3:
+                        continue
+                    try:
+                        self._apply(parts[2], float(parts[0]), float(parts[1]))
+                    except ValueError:
+                        continue
+                    self.line_count += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"Could not read usage log: {e}")
+
+    def record(self, url, timestamp=None):
+        """Record one open of url and append it to the log"""
+        if not url:
+            return
+        timestamp = timestamp or time.time()
+
+        with self._lock:
+            self._apply(url, timestamp, 1.0)
+            self.version += 1
+
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as log_file:
+                    log_file.write(f"{timestamp:.0f}\t1\t{url}\n")
+                self.line_count += 1
+            except OSError as e:
+                self.logger.warning(f"Could not write usage log: {e}")
+                return
+
+            if self.line_count > max(USAGE_COMPACT_MIN_LINES, 2 * len(self.scores)):
+                self._compact()
+
+    def compact(self):
+        """Rewrite the log with one aggregated line per URL, dropping stale entries"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        now = time.time()
+        self.scores = {
+            url: (score, last_time) for url, (score, last_time) in self.scores.items()
+            if self._decay(score, last_time, now) >= USAGE_MIN_SCORE
+        }
+        tmp_path = f"{self.path}.tmp"
+
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as log_file:
+                for url, (score, last_time) in self.scores.items():
+                    log_file.write(f"{last_time:.0f}\t{score:.4f}\t{url}\n")
+            os.replace(tmp_path, self.path)
+            self.line_count = len(self.scores)
+            self.logger.info(f"Compacted usage log to {self.line_count} entries")
+        except OSError as e:
+            self.logger.warning(f"Could not compact usage log: {e}")
+
+    def score(self, url, now=None):
+        """Frecency score of url decayed to now"""
+        entry = self.scores.get(url)
+        if not entry:
+            return 0.0
+        return self._decay(entry[0], entry[1], now or time.time())
+
+
+class TagVocabulary:
+    """Append-only mapping between tag names and small integer ids
+
+    Ids are never reused or renumbered, so a vocabulary can be shared by every
+    copy of a TagIndex; names are interned so each tag string is stored once.
+    """
+
+    def __init__(self):
+        self.ids = {}  # tag -> id
+        self.names = []  # id -> tag
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, tag):
+        """Id of tag, assigning the next free id if it is new"""
+        tag_id = self.ids.get(tag)
+        if tag_id is not None:
+            return tag_id
+
+        with self._lock:
+            tag_id = self.ids.get(tag)
+            if tag_id is None:
+                tag_id = len(self.names)
+                self.names.append(sys.intern(tag))  # Published before the id, for lock-free readers
+                self.ids[self.names[tag_id]] = tag_id
+            return tag_id
+
+    def lookup(self, tag):
+        """Id of tag, or None if it was never interned"""
+        return self.ids.get(tag)
+
+    def encode(self, tags):
+        """Compact id array for a list of tags, interning new ones"""
+        return array('I', (self.intern(tag) for tag in tags))
+
+
+class TagIndex:
+    """Sparse tag co-occurrence index over the bookmark set, keyed by bookmark URL
+
+    Tags are stored as integer ids from a shared TagVocabulary and only turned
+    back into names at the edges. Kept up to date incrementally: ``sync`` only
+    touches bookmarks that were added, removed or retagged since the previous sync.
+    """
+
+    def __init__(self, vocabulary=None):
+        self.vocabulary = vocabulary if vocabulary is not None else TagVocabulary()
+        self.bookmark_tags = {}  # href -> array of tag ids
+        self.postings = {}  # tag id -> set of hrefs
+        self.cooccurrence = {}  # tag id -> {other tag id: number of bookmarks with both}
+        self._related_cache = {}
+
+    def __len__(self):
+        return len(self.bookmark_tags)
+
+    @staticmethod
+    def split_tags(tags):
+        """Unique tags of a bookmark, from a space-separated string or a list"""
+        if isinstance(tags, str):
+            tags = tags.split()
+        return tuple(dict.fromkeys(tag for tag in tags if tag))
+
+    def _known_ids(self, tags):
+        """Id array for tags without interning, or None if any tag is new"""
+        tag_ids = array('I')
+        for tag in self.split_tags(tags):
+            tag_id = self.vocabulary.lookup(tag)
+            if tag_id is None:
+                return None
+            tag_ids.append(tag_id)
+        return tag_ids
+
+    def add(self, href, tags):
+        """Index a bookmark, replacing its previous tags if it is already indexed"""
+        tag_ids = self.vocabulary.encode(self.split_tags(tags))
+        if self.bookmark_tags.get(href) == tag_ids:
+            return
+        self.remove(href)
+        self.bookmark_tags[href] = tag_ids
+
+        for tag_id in tag_ids:
+            self.postings.setdefault(tag_id, set()).add(href)
+            related = self.cooccurrence.setdefault(tag_id, {})
+            for other in tag_ids:
+                if other != tag_id:
+                    related[other] = related.get(other, 0) + 1
+        self._related_cache.clear()
+
+    def remove(self, href):
+        tag_ids = self.bookmark_tags.pop(href, None)
+        if tag_ids is None:
+            return
+
+        for tag_id in tag_ids:
+            postings = self.postings[tag_id]
+            postings.discard(href)
+            if not postings:
+                del self.postings[tag_id]
+            related = self.cooccurrence.get(tag_id, {})
+            for other in tag_ids:
+                if other != tag_id:
+                    related[other] -= 1
+                    if not related[other]:
+                        del related[other]
+            if not related:
+                self.cooccurrence.pop(tag_id, None)
+        self._related_cache.clear()
+
+    def copy(self):
+        # Id arrays are never mutated in place, so they are shared with the copy
+        clone = TagIndex(self.vocabulary)
+        clone.bookmark_tags = dict(self.bookmark_tags)
+        clone.postings = {tag_id: set(hrefs) for tag_id, hrefs in self.postings.items()}
+        clone.cooccurrence = {tag_id: dict(related) for tag_id, related in self.cooccurrence.items()}
+        return clone
+
+    def sync(self, bookmarks):
+        """Apply the difference between the indexed bookmarks and a fresh bookmark list"""
+        current = {}
+        for bookmark in bookmarks:
+            href = bookmark.get('href')
+            if href:
+                current[href] = bookmark.get('tags', '')
+
+        for href in [href for href in self.bookmark_tags if href not in current]:
+            self.remove(href)
+        for href, tags in current.items():
+            self.add(href, tags)
+
+    def synced(self, bookmarks):
+        """Copy of the index synced with bookmarks, or the index itself if nothing changed"""
+        hrefs = set()
+        for bookmark in bookmarks:
+            href = bookmark.get('href')
+            if href:
+                hrefs.add(href)
+                tag_ids = self._known_ids(bookmark.get('tags', ''))
+                if tag_ids is None or self.bookmark_tags.get(href) != tag_ids:  # None: a tag is new
+                    break
+        else:
+            if len(hrefs) == len(self.bookmark_tags):
+                return self
+
+        clone = self.copy()
+        clone.sync(bookmarks)
+        return clone
+
+    def _ids(self, tags):
+        """Set of ids for tag names, or None if any of them was never interned"""
+        tag_ids = frozenset(self.vocabulary.lookup(tag) for tag in tags)
+        return None if None in tag_ids else tag_ids
+
+    def _intersection(self, key):
+        postings = sorted((self.postings.get(tag_id, set()) for tag_id in key), key=len)
+        return set(postings[0]).intersection(*postings[1:]) if postings else set()
+
+    def hrefs_with_all(self, tags):
+        """URLs of the bookmarks carrying every one of the given tags"""
+        key = self._ids(tags)
+        return self._intersection(key) if key else set()
+
+    def _related_ids(self, key):
+        if len(key) == 1:
+            return dict(self.cooccurrence.get(next(iter(key)), {}))
+
+        counts = {}
+        for href in self._intersection(key):
+            for tag_id in self.bookmark_tags[href]:
+                if tag_id not in key:
+                    counts[tag_id] = counts.get(tag_id, 0) + 1
+        return counts
+
+    def related(self, selected):
+        """Tags that co-occur with every selected tag, with their conditional counts"""
+        key = self._ids(selected)
+        if key is None:
+            return {}  # An unknown tag has no bookmarks, so nothing co-occurs with it
+        if key in self._related_cache:
+            return self._related_cache[key]
+
+        names = self.vocabulary.names
+        counts = {names[tag_id]: count for tag_id, count in self._related_ids(key).items()}
+        self._related_cache[key] = counts
+        return counts
+
+
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid',
+    'mc_cid', 'mc_eid', '_hsenc', '_hsmi', 'ref_src'
+}
+DEFAULT_PORTS = (':80', ':443')
+
+
+def normalize_url(url):
+    """Canonical form of a URL used to detect duplicates
+
+    The scheme is dropped, the host is case-folded, default ports, tracking
+    parameters and trailing slashes are stripped. Path, remaining query and
+    fragment are kept as they are.
+    """
+    url = url.strip()
+    parts = urllib.parse.urlsplit(url)
+    if not parts.netloc and '://' not in url:
+        parts = urllib.parse.urlsplit(f'//{url}')
+
+    netloc = parts.netloc.casefold()
+    for port in DEFAULT_PORTS:
+        if netloc.endswith(port):
+            netloc = netloc[:-len(port)]
+
+    params = [
+        (key, value) for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS
+    ]
+    normalized = netloc + parts.path.rstrip('/')
+    if params:
+        normalized += '?' + urllib.parse.urlencode(params)
+    if parts.fragment:
+        normalized += '#' + parts.fragment
+    return normalized
+
+
+class UrlIndex:
+    """Hash index from normalized URL to the bookmarks saved under it
+
+    Colliding keys are tracked as bookmarks come and go, so listing duplicates
+    never needs to compare bookmarks pairwise.
+    """
+
+    def __init__(self):
+        self.bookmarks = {}  # href -> bookmark
+        self.keys = {}  # normalized url -> {href: bookmark}
+        self.duplicate_keys = set()
+
+    def __len__(self):
+        return len(self.bookmarks)
+
+    def __contains__(self, url):
+        return normalize_url(url) in self.keys
+
+    def add(self, bookmark):
+        href = bookmark.get('href')
+        if not href:
+            return
+        self.remove(href)
+        key = normalize_url(href)
+        self.bookmarks[href] = bookmark
+        saved = self.keys.setdefault(key, {})
+        saved[href] = bookmark
+        if len(saved) > 1:
+            self.duplicate_keys.add(key)
+
+    def remove(self, href):
+        if self.bookmarks.pop(href, None) is None:
+            return
+        key = normalize_url(href)
+        saved = self.keys[key]
+        del saved[href]
+        if len(saved) < 2:
+            self.duplicate_keys.discard(key)
+        if not saved:
+            del self.keys[key]
+
+    def sync(self, bookmarks):
+        """Apply the difference between the indexed bookmarks and a fresh bookmark list"""
+        current = {bookmark['href']: bookmark for bookmark in bookmarks if bookmark.get('href')}
+
+        for href in [href for href in self.bookmarks if href not in current]:
+            self.remove(href)
+        for href, bookmark in current.items():
+            if self.bookmarks.get(href) != bookmark:
+                self.add(bookmark)
+
+    def copy(self):
+        clone = UrlIndex()
+        clone.bookmarks = dict(self.bookmarks)
+        clone.keys = {key: dict(saved) for key, saved in self.keys.items()}
+        clone.duplicate_keys = set(self.duplicate_keys)
+        return clone
+
+    def synced(self, bookmarks):
+        """Copy of the index synced with bookmarks, or the index itself if nothing changed"""
+        current = {bookmark['href']: bookmark for bookmark in bookmarks if bookmark.get('href')}
+        if len(current) == len(self.bookmarks) and all(
+                self.bookmarks.get(href) == bookmark for href, bookmark in current.items()):
+            return self
+
+        clone = self.copy()
+        clone.sync(bookmarks)
+        return clone
+
+    def find(self, url):
+        """Bookmarks saved under the same normalized URL"""
+        return list(self.keys.get(normalize_url(url), {}).values())
+
+    def duplicates(self):
+        """Groups of bookmarks that share a normalized URL"""
+        return [list(self.keys[key].values()) for key in sorted(self.duplicate_keys)]
+
+
+def _bookmark_from_entry(entry):
+    """Pinboard-style bookmark dict from an imported JSON object"""
+    href = str(entry.get('href') or entry.get('url') or entry.get('uri') or '')
+    tags = entry.get('tags') or ''
+    if isinstance(tags, list):
+        tags = ' '.join(str(tag) for tag in tags if tag is not None)
+    return {
+        'href': href,
+        'description': str(entry.get('description') or entry.get('title') or href),
+        'extended': str(entry.get('extended') or ''),
+        'tags': str(tags).replace(',', ' '),
+        'time': str(entry.get('time') or '')
+    }
+
+
+class NetscapeBookmarkParser(HTMLParser):
+    """Incremental parser for Netscape bookmark files (the browser HTML export format)
+
+    Completed bookmarks are collected in ``bookmarks`` as the file is fed, so the
+    caller can drain them after every chunk.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.bookmarks = []
+        self._current = None  # bookmark whose <A> is open
+        self._pending = None  # last closed bookmark, waiting for an optional <DD>
+        self._in_description = False
+
+    def _flush(self):
+        if self._pending:
+            self._pending['extended'] = self._pending['extended'].strip()
+            self.bookmarks.append(self._pending)
+            self._pending = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self._flush()
+            attrs = dict(attrs)
+            add_date = attrs.get('add_date') or ''  # Valueless attributes come as None
+            self._current = {
+                'href': attrs.get('href') or '',
+                'description': '',
+                'extended': '',
+                'tags': (attrs.get('tags') or '').replace(',', ' '),
+                'time': (datetime.fromtimestamp(int(add_date), timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+                         if add_date.isdigit() else '')
+            }
+        elif tag == 'dd' and self._pending:
+            self._in_description = True
+        elif tag in ('dt', 'dl', 'h3'):
+            self._in_description = False
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self._current:
+            self._current['description'] = self._current['description'].strip() or self._current['href']
+            self._pending = self._current
+            self._current = None
+        elif tag == 'dl':
+            self._flush()
+
+    def handle_data(self, data):
+        if self._current:
+            self._current['description'] += data
+        elif self._in_description and self._pending:
+            self._pending['extended'] += data  # Stripped once complete, as it may span chunks
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def iter_netscape_bookmarks(file, chunk_size=IMPORT_CHUNK_SIZE):
+    """Stream bookmarks from a Netscape bookmark file object"""
+    parser = NetscapeBookmarkParser()
+    while True:
+        chunk = file.read(chunk_size)
+        if chunk:
+            parser.feed(chunk)
+        else:
+            parser.close()
+        yield from parser.bookmarks
+        parser.bookmarks = []
+        if not chunk:
+            return
+
+
+def iter_json_bookmarks(file, chunk_size=IMPORT_CHUNK_SIZE):
+    """Stream bookmarks from a JSON array (such as Pinboard's export) or JSON lines file object"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n[,]')
+        if buffer:
+            try:
+                entry, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                buffer = buffer[end:]
+                if isinstance(entry, dict):
+                    yield _bookmark_from_entry(entry)
+                continue
+        elif eof:
+            return
+
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_bookmark_file(file, path):
+    """Stream bookmarks from an open bookmark file, picking the format from its name"""
+    if path.lower().endswith(('.html', '.htm')):
+        return iter_netscape_bookmarks(file)
+    return iter_json_bookmarks(file)
+
+
+def export_bookmarks(bookmarks, path):
+    """Write bookmarks to path as Netscape HTML or JSON, one bookmark at a time
+
+    The file is written next to its destination and moved into place once complete.
+    """
+    as_html = path.lower().endswith(('.html', '.htm'))
+    tmp_path = f"{path}.tmp"
+    count = 0
+
+    with open(tmp_path, 'w', encoding='utf-8') as export_file:
+        if as_html:
+            export_file.write('<!DOCTYPE NETSCAPE-Bookmark-file-1>\n'
+                              '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">\n'
+                              '<TITLE>Pinboard</TITLE>\n<H1>Pinboard</H1>\n<DL><p>\n')
+        else:
+            export_file.write('[')
+
+        for bookmark in bookmarks:
+            if as_html:
+                try:
+                    add_date = str(int(datetime.strptime(bookmark.get('time', ''), '%Y-%m-%dT%H:%M:%SZ')
+                                       .replace(tzinfo=timezone.utc).timestamp()))
+                except ValueError:
+                    add_date = ''
+                export_file.write(
+                    f'<DT><A HREF="{html.escape(bookmark.get("href", ""))}" ADD_DATE="{add_date}" '
+                    f'TAGS="{html.escape(",".join(bookmark.get("tags", "").split()))}">'
+                    f'{html.escape(bookmark.get("description", ""))}</A>\n'
+                )
+                if bookmark.get('extended'):
+                    export_file.write(f'<DD>{html.escape(bookmark["extended"])}\n')
+            else:
+                export_file.write((',\n' if count else '\n') + json.dumps(bookmark, ensure_ascii=False))
+            count += 1
+
+        export_file.write('</DL><p>\n' if as_html else '\n]\n')
+
+    os.replace(tmp_path, path)
+    return count
+
+
+class ImportJob(threading.Thread):
+    """Background upload of a bookmark file, one rate-limited posts/add call at a time
+
+    Bookmarks whose URL is already saved, or appeared earlier in the file, are
+    skipped without an API call. The number of entries handled is checkpointed
+    to a state file in DATA_DIR, so starting the same file again resumes where
+    the previous run stopped.
+    """
+
+    def __init__(self, store, path):
+        super().__init__(daemon=True)
+        self.store = store
+        self.token = store.get_token()  # Uploads go to the account the import was started for
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.state_path = os.path.join(
+            DATA_DIR, f"import-{hashlib.sha1(self.path.encode('utf-8')).hexdigest()[:12]}.json"
+        )
+        self.stop_requested = threading.Event()
+        self.processed = 0
+        self.added = 0
+        self.skipped = 0
+        self.failed = 0
+        self.progress = 0.0  # Fraction of the file read so far
+        self.done = False
+        self.error_message = None
+
+    def status(self):
+        state = 'Finished' if self.done else 'Stopped' if self.stop_requested.is_set() else f"{self.progress:.0%}"
+        return (f"{state}: {self.added} added, {self.skipped} skipped, {self.failed} failed "
+                f"({os.path.basename(self.path)})")
+
+    def stop(self):
+        self.stop_requested.set()
+
+    def _load_state(self, size):
+        try:
+            with open(self.state_path, encoding='utf-8') as state_file:
+                state = json.load(state_file)
+            if state.get('path') == self.path and state.get('size') == size:
+                return state
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _save_state(self, size):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(self.state_path, 'w', encoding='utf-8') as state_file:
+            json.dump({'path': self.path, 'size': size, 'processed': self.processed,
+                       'added': self.added, 'skipped': self.skipped, 'failed': self.failed}, state_file)
+
+    def _upload(self, bookmark):
+        """Post one bookmark, waiting out rate limits; returns the result code"""
+        backoff = IMPORT_RATE_LIMIT_SECONDS
+        while not self.stop_requested.is_set():
+            try:
+                return self.store.post_bookmark(
+                    bookmark['href'], bookmark['description'][:255], bookmark['extended'],
+                    bookmark['tags'].split(), replace=False, dt=bookmark['time'] or None,
+                    auth_token=self.token
+                )
+            except urllib.error.HTTPError as e:
+                if e.code != 429:
+                    raise
+                self.store.logger.info(f"Rate limited while importing, retrying in {backoff}s")
+                self.stop_requested.wait(backoff)
+                backoff = min(backoff * 2, IMPORT_MAX_BACKOFF_SECONDS)
+        return None
+
+    def run(self):
+        logger = self.store.logger
+        try:
+            size = os.path.getsize(self.path)
+            state = self._load_state(size)
+            resume_from = state.get('processed', 0)
+            self.added = state.get('added', 0)
+            self.skipped = state.get('skipped', 0)
+            self.failed = state.get('failed', 0)
+            if resume_from:
+                logger.info(f"Resuming import of {self.path} after {resume_from} bookmarks")
+
+            last_call = 0.0
+            seen = set()  # Normalized URLs met earlier in the file, which the URL index does not know yet
+            with open(self.path, encoding='utf-8', errors='replace') as import_file:
+                for bookmark in iter_bookmark_file(import_file, self.path):
+                    if self.stop_requested.is_set():
+                        break
+                    self.processed += 1
+                    self.progress = import_file.buffer.tell() / size if size else 1.0
+                    url_key = normalize_url(bookmark['href']) if bookmark['href'] else None
+                    repeated = url_key in seen
+                    seen.add(url_key)
+                    if self.processed <= resume_from:
+                        continue
+
+                    if not bookmark['href'] or repeated or bookmark['href'] in self.store.url_index:
+                        self.skipped += 1
+                        if self.processed % 100 == 0:
+                            self._save_state(size)
+                    else:
+                        self.stop_requested.wait(max(0.0, last_call + IMPORT_RATE_LIMIT_SECONDS - time.monotonic()))
+                        try:
+                            result_code = self._upload(bookmark)
+                        except Exception as e:
+                            result_code = str(e)
+                        last_call = time.monotonic()
+                        if result_code is None:  # Stopped while waiting
+                            self.processed -= 1
+                            break
+                        if result_code == 'done':
+                            self.added += 1
+                        elif result_code == 'item already exists':
+                            self.skipped += 1
+                        else:
+                            self.failed += 1
+                            logger.warning(f"Could not import {bookmark['href']}: {result_code}")
+                        self._save_state(size)
+
+                    if self.processed % 100 == 0:
+                        logger.info(f"Import progress: {self.status()}")
+                else:
+                    self.done = True
+
+            if not self.done:
+                self._save_state(size)
+            elif os.path.exists(self.state_path):
+                os.remove(self.state_path)
+            logger.info(f"Import {self.status()}")
+        except Exception as e:
+            self.error_message = str(e)
+            logger.error(f"Import of {self.path} failed: {e}")
+        finally:
+            if self.added:
+                # Refetch once at the end instead of after every upload
+                self.store.invalidate()
+
+
+class Snapshot(NamedTuple):
+    """Loaded data and its indexes, published as a whole and never modified afterwards
+
+    Readers take ``store.snapshot`` once and get a consistent view without
+    locking; writers build a new snapshot and swap it in.
+    """
+    version: int
+    cache: Mapping  # Read-only mapping of cache key -> API data
+    fetched_at: Optional[datetime]
+    error_message: Optional[str]
+    tag_index: TagIndex
+    url_index: UrlIndex
+
+
+EMPTY_CACHE = MappingProxyType({})
+
+
+class PinboardStore:
+    """Fetches, caches and indexes Pinboard data, and answers queries over it
+
+    ``preferences`` uses the same keys as the extension preferences in
+    manifest.json; the extension passes its own preferences dict so changes
+    made in Ulauncher apply immediately. With ``persist_bookmarks`` the full
+    bookmark list is also kept in DATA_DIR for cache_time, so short-lived
+    processes such as the command line share it instead of each calling
+    posts/all, which Pinboard allows only once every 5 minutes.
+    """
+
+    def __init__(self, preferences=None, logger=None, usage_log_path=USAGE_LOG_PATH, persist_bookmarks=False):
+        self.preferences = preferences if preferences is not None else {}
+        self.logger = logger or logging.getLogger(__name__)
+        self.persist_bookmarks = persist_bookmarks
+        self.usage_log = UsageLog(usage_log_path, logger=self.logger)
+        self.import_job = None
+        self.snapshot = Snapshot(0, EMPTY_CACHE, None, None, TagIndex(), UrlIndex())
+        self._publish_lock = threading.Lock()  # Serializes writers only
+        self._inflight = {}  # (token, cache key) -> Future of the fetch in progress
+        self._inflight_lock = threading.Lock()
+        self._api_lock = threading.Lock()  # Held while waiting for the next API slot
+        self._last_api_call = 0.0
+
+    @property
+    def cache(self):
+        return self.snapshot.cache
+
+    @property
+    def last_cache_time(self):
+        return self.snapshot.fetched_at
+
+    @property
+    def error_message(self):
+        return self.snapshot.error_message
+
+    @property
+    def tag_index(self):
+        return self.snapshot.tag_index
+
+    @property
+    def url_index(self):
+        return self.snapshot.url_index
+
+    def _swap(self, update=None, **changes):
+        """Publish a new snapshot with changes applied
+
+        update, if given, is called with the current snapshot under the writer
+        lock and returns further changes, so they are computed from the latest data.
+        """
+        with self._publish_lock:
+            snapshot = self.snapshot
+            if update:
+                changes.update(update(snapshot))
+            self.snapshot = snapshot._replace(version=snapshot.version + 1, **changes)
+
+    def invalidate(self):
+        """Drop cached API data; indexes are kept and synced on the next fetch"""
+        self._drop_persisted_bookmarks()
+        self._swap(cache=EMPTY_CACHE, fetched_at=None)
+
+    def get_token(self):
+        return self.preferences.get('pinboard_token', '')
+
+    def _wait_for_api_slot(self):
+        """Block until API_MIN_INTERVAL_SECONDS have passed since the previous request started"""
+        with self._api_lock:
+            delay = self._last_api_call + API_MIN_INTERVAL_SECONDS - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._last_api_call = time.monotonic()
+
+    def api_get(self, method, **params):
+        """Call a Pinboard API method and return its decoded JSON response
+
+        Requests from every thread are started at least API_MIN_INTERVAL_SECONDS apart.
+        """
+        self._wait_for_api_slot()
+        query_string = urllib.parse.urlencode({'auth_token': self.get_token(), 'format': 'json', **params})
+        with urllib.request.urlopen(f'https://api.pinboard.in/v1/{method}?{query_string}', timeout=10) as response:
+            return json.loads(response.read())
+
+    def _cached(self, cache_key):
+        """Cached value for cache_key, or None if missing or expired"""
+        cache_time_minutes = int(self.preferences.get('cache_time', '5'))
+        cache_time_seconds = cache_time_minutes * 60
+        snapshot = self.snapshot
+
+        if (snapshot.fetched_at and
+            (datetime.now() - snapshot.fetched_at).total_seconds() < cache_time_seconds):
+            return snapshot.cache.get(cache_key)
+        return None
+
+    def _publish(self, entries, fetch_time):
+        """Publish freshly fetched cache entries in a new snapshot
+
+        When the entries include the full bookmark list, the snapshot also gets
+        indexes synced with it, copied from the previous ones if anything changed.
+        """
+        def update(snapshot):
+            changes = {'cache': MappingProxyType({**snapshot.cache, **entries})}
+            if 'bookmarks_' in entries:
+                changes['tag_index'] = snapshot.tag_index.synced(entries['bookmarks_'])
+                changes['url_index'] = snapshot.url_index.synced(entries['bookmarks_'])
+            return changes
+
+        self._swap(update, fetched_at=fetch_time, error_message=None)
+
+    def _persisted_bookmarks_path(self):
+        token_hash = hashlib.sha1(self.get_token().encode('utf-8')).hexdigest()[:12]
+        return os.path.join(DATA_DIR, f"bookmarks-{token_hash}.json")
+
+    def _load_persisted_bookmarks(self):
+        """Bookmark list persisted by an earlier process, or None if missing or expired"""
+        path = self._persisted_bookmarks_path()
+        cache_time_seconds = int(self.preferences.get('cache_time', '5')) * 60
+        try:
+            if time.time() - os.path.getmtime(path) >= cache_time_seconds:
+                return None
+            with open(path, encoding='utf-8') as bookmarks_file:
+                bookmarks = json.load(bookmarks_file)
+        except (OSError, ValueError):
+            return None
+        self.logger.info(f"Loaded {len(bookmarks)} bookmarks from {path}")
+        return bookmarks
+
+    def _persist_bookmarks(self, bookmarks):
+        path = self._persisted_bookmarks_path()
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as bookmarks_file:
+                json.dump(bookmarks, bookmarks_file, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.warning(f"Could not save bookmarks to {path}: {e}")
+
+    def _drop_persisted_bookmarks(self):
+        if not self.persist_bookmarks:
+            return
+        try:
+            os.remove(self._persisted_bookmarks_path())
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"Could not remove saved bookmarks: {e}")
+
+    def _fetch_bookmarks(self, tag=''):
+        if tag or not self.persist_bookmarks:
+            return self.api_get('posts/all', **({'tag': tag} if tag else {}))
+
+        bookmarks = self._load_persisted_bookmarks()
+        if bookmarks is None:
+            bookmarks = self.api_get('posts/all')
+            self._persist_bookmarks(bookmarks)
+        return bookmarks
+
+    def _fetch_recent_bookmarks(self, count):
+        return self.api_get('posts/recent', count=count).get('posts', [])
+
+    def _fetch_tags(self):
+        tags_data = self.api_get('tags/get')
+        # Share the interned tag strings with the tag index
+        vocabulary = self.tag_index.vocabulary
+        tags = [
+            {'name': vocabulary.names[vocabulary.intern(tag)], 'count': int(count)}
+            for tag, count in tags_data.items()
+        ]
+
+        # Sort tags based on user preference
+        self.sort_tags(tags)
+        return tags
+
+    def _get(self, cache_key, fetch, *args):
+        """Return cache_key from the cache, fetching and publishing it on a miss
+
+        Misses for a key that is already being fetched, by the warm-up or another
+        view, wait for that fetch instead of sending the same request again.
+        """
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+
+        token = self.get_token()
+        inflight_key = (token, cache_key)
+        with self._inflight_lock:
+            future = self._inflight.get(inflight_key)
+            if future is None:
+                # Checked again here: a fetch may have been published since the first check
+                cached = self._cached(cache_key)
+                if cached is not None:
+                    return cached
+                owner_future = self._inflight[inflight_key] = Future()
+            else:
+                owner_future = None
+        if owner_future is None:
+            self.logger.info(f"Waiting for the fetch of {cache_key} in progress")
+            return future.result()
+
+        # Not in cache, fetch from API
+        self.logger.info(f"Cache miss for {cache_key}")
+        current_time = datetime.now()
+        value = []
+        try:
+            value = fetch(*args)
+            if token == self.get_token():
+                self._publish({cache_key: value}, current_time)
+            else:
+                self.logger.info(f"Token changed while fetching {cache_key}, discarding it")
+        except Exception as e:
+            self._swap(error_message=str(e))
+        finally:
+            with self._inflight_lock:
+                del self._inflight[inflight_key]
+            owner_future.set_result(value)
+        return value
+
+    def get_bookmarks(self, tag=''):
+        """Get bookmarks from Pinboard API"""
+        if not self.get_token():
+            return []
+        return self._get(f'bookmarks_{tag}', self._fetch_bookmarks, tag)
+
+    def get_recent_bookmarks(self, count=None):
+        """Get recent bookmarks from Pinboard API"""
+        if not self.get_token():
+            return []
+
+        # Use the count parameter if provided, otherwise get from preferences
+        if count is None:
+            count = int(self.preferences.get('recent_count', '20'))
+
+        self.logger.info(f"Fetching {count} recent bookmarks")
+        return self._get(f'recent_bookmarks_{count}', self._fetch_recent_bookmarks, count)
+
+    def get_tags(self):
+        """Get tags from Pinboard API"""
+        if not self.get_token():
+            return []
+        return self._get('tags', self._fetch_tags)
+
+    def warm_up(self):
+        """Fetch all bookmarks, recent bookmarks and tags concurrently in the background
+
+        Only stale datasets are fetched, and each one is published as soon as it
+        arrives. A view that needs a dataset still being fetched waits for it rather
+        than requesting it again, and api_get spaces the requests to respect
+        Pinboard's rate limit while downloads and parsing overlap.
+        """
+        if not self.get_token():
+            return None
+
+        thread = threading.Thread(target=self._warm_up, name='pinboard-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_up(self):
+        count = int(self.preferences.get('recent_count', '20'))
+        # The largest download goes first so it overlaps with the others
+        tasks = [
+            ('bookmarks_', self._fetch_bookmarks),
+            ('tags', self._fetch_tags),
+            (f'recent_bookmarks_{count}', lambda: self._fetch_recent_bookmarks(count))
+        ]
+        tasks = [(key, fetch) for key, fetch in tasks if self._cached(key) is None]
+        if not tasks:
+            return
+
+        self.logger.info(f"Warming up: {', '.join(key for key, _ in tasks)}")
+        current_time = datetime.now()
+        with ThreadPoolExecutor(max_workers=WARMUP_WORKERS) as pool:
+            for key, fetch in tasks:
+                pool.submit(self._get, key, fetch)
+        self.logger.info(f"Warm-up done in {(datetime.now() - current_time).total_seconds():.1f}s")
+
+    def reset(self):
+        """Forget all cached data and indexes, e.g. when the token changes"""
+        self._swap(cache=EMPTY_CACHE, fetched_at=None, error_message=None,
+                   tag_index=TagIndex(), url_index=UrlIndex())
+
+    def get_selection_tags(self, selected_tags):
+        """Get tags for the tag browser, narrowed down by the selected tags
+
+        With no selection this is the global tag list. Otherwise only tags that
+        co-occur with every selected tag are kept, and all counts are taken within
+        the bookmarks carrying every selected tag, as searched by filter_bookmarks.
+        """
+        tags = self.get_tags()
+        if not selected_tags:
+            return tags
+
+        self.get_bookmarks()  # Keeps the tag index in sync with the bookmark set
+        return self.narrow_tags(tags, selected_tags, self.tag_index)
+
+    @staticmethod
+    def narrow_tags(tags, selected_tags, tag_index):
+        """get_selection_tags over an already loaded tag list and tag index"""
+        if not selected_tags or not tag_index:
+            return tags
+
+        related = tag_index.related(selected_tags)
+        selection_count = len(tag_index.hrefs_with_all(selected_tags))
+        return [
+            {'name': tag['name'], 'count': selection_count if tag['name'] in selected_tags else related[tag['name']]}
+            for tag in tags
+            if tag['name'] in selected_tags or tag['name'] in related
+        ]
+
+    @staticmethod
+    def matches(bookmark, query):
+        """Whether query appears in the title, description or URL of a bookmark"""
+        query = query.lower()
+        return (query in bookmark.get('description', '').lower() or
+                query in bookmark.get('extended', '').lower() or
+                query in bookmark.get('href', '').lower())
+
+    @classmethod
+    def select_bookmarks(cls, bookmarks, query='', tags=None, tag_index=None):
+        """Already loaded bookmarks matching query, carrying all of the given tags if any"""
+        if not tags:
+            return [b for b in bookmarks if cls.matches(b, query)]
+
+        # Bookmarks carrying every selected tag, looked up in the tag index instead of the API
+        hrefs = tag_index.hrefs_with_all(tags)
+        return [b for b in bookmarks if b.get('href') in hrefs and cls.matches(b, query)]
+
+    def filter_bookmarks(self, query='', tags=None):
+        """Bookmarks matching query, carrying all of the given tags if any, unsorted"""
+        bookmarks = self.get_bookmarks()
+        return self.select_bookmarks(bookmarks, query, tags, self.tag_index)
+
+    def filter_recent(self, query='', count=None):
+        """Recent bookmarks matching query, unsorted"""
+        return self.select_bookmarks(self.get_recent_bookmarks(count), query)
+
+    def search(self, query='', tags=None):
+        """Search bookmarks, carrying all of the given tags if any, ranked by preference"""
+        bookmarks = self.filter_bookmarks(query, tags)
+        self.rank_bookmarks(bookmarks)
+        return bookmarks
+
+    def recent(self, query='', count=None):
+        """Filter recent bookmarks by query, ranked by preference"""
+        bookmarks = self.filter_recent(query, count)
+        self.rank_bookmarks(bookmarks)
+        return bookmarks
+
+    def sort_tags(self, tags):
+        """Sort tags in place according to the sort_tags preference"""
+        if self.preferences.get('sort_tags', 'count') == 'alpha':
+            tags.sort(key=lambda x: x['name'].lower())
+        else:  # default: sort by count
+            tags.sort(key=lambda x: x['count'], reverse=True)
+
+    def sync(self):
+        """Drop cached data and fetch bookmarks and tags again"""
+        self.invalidate()
+        bookmarks = self.get_bookmarks()
+        tags = self.get_tags()
+        return {'bookmarks': len(bookmarks), 'tags': len(tags), 'error': self.error_message}
+
+    def stats(self):
+        """Sizes of the loaded data and indexes"""
+        bookmarks = self.get_bookmarks()
+        snapshot = self.snapshot
+        return {
+            'bookmarks': len(bookmarks),
+            'tags': len(snapshot.tag_index.postings),
+            'tag_vocabulary': len(snapshot.tag_index.vocabulary),
+            'tag_pairs': sum(len(related) for related in snapshot.tag_index.cooccurrence.values()) // 2,
+            'duplicate_urls': len(snapshot.url_index.duplicate_keys),
+            'opened_bookmarks': len(self.usage_log.scores),
+            'usage_log_lines': self.usage_log.line_count,
+            'snapshot_version': snapshot.version,
+            'cache_age_seconds': ((datetime.now() - snapshot.fetched_at).total_seconds()
+                                  if snapshot.fetched_at else None),
+            'error': snapshot.error_message
+        }
+
+    def find_saved_bookmarks(self, url):
+        """Get bookmarks already saved under the same normalized URL"""
+        self.get_bookmarks()  # Keeps the URL index in sync with the bookmark set
+        return self.url_index.find(url)
+
+    def find_duplicate_bookmarks(self):
+        """Get groups of bookmarks saved more than once under the same normalized URL"""
+        self.get_bookmarks()
+        return self.url_index.duplicates()
+
+    def rank_bookmarks(self, bookmarks):
+        """Sort bookmarks in place according to the sort_bookmarks preference"""
+        sort_preference = self.preferences.get('sort_bookmarks', 'time')
+        self.logger.info(f"Sorting bookmarks by: {sort_preference}")
+
+        if sort_preference == 'title':
+            bookmarks.sort(key=lambda x: x.get('description', '').lower())
+        elif sort_preference == 'frecency':
+            # Most used first, falling back to most recent for ties and unused bookmarks
+            now = time.time()
+            bookmarks.sort(key=lambda x: (self.usage_log.score(x.get('href', ''), now),
+                                          x.get('time', '')), reverse=True)
+        else:  # default: sort by time
+            bookmarks.sort(key=lambda x: x.get('time', ''), reverse=True)
+
+    def record_open(self, url):
+        """Record that a bookmark was opened so it can be ranked by frecency"""
+        self.logger.info(f"Opening bookmark: {url}")
+        self.usage_log.record(url)
+
+    def post_bookmark(self, url, title, description='', tags=None, replace=True, dt=None, auth_token=None):
+        """Call posts/add and return its result code, leaving caches untouched
+
+        auth_token overrides the token from the preferences. Network and HTTP
+        errors are raised to the caller.
+        """
+        tags_str = ','.join(tags) if tags else ''
+        params = {
+            'url': url,
+            'description': title,
+            'extended': description,
+            'tags': tags_str,
+            'replace': 'yes' if replace else 'no',
+            'shared': 'no'
+        }
+        if dt:
+            params['dt'] = dt
+        if auth_token:
+            params['auth_token'] = auth_token
+
+        self.logger.info(f"Adding bookmark: {title} ({url})")
+        return self.api_get('posts/add', **params).get('result_code')
+
+    def add_bookmark(self, url, title, description='', tags=None, replace=False):
+        """Save a bookmark and update the cached data; returns Pinboard's result code
+
+        The result is 'done' once saved. Unless replace is set, a bookmark already
+        saved under the same URL is left untouched and 'item already exists' is
+        returned. None means the request failed, with error_message set.
+        """
+        if not self.get_token() or not url:
+            return None
+
+        try:
+            result_code = self.post_bookmark(url, title, description, tags, replace=replace)
+        except Exception as e:
+            self._swap(error_message=str(e))
+            return None
+
+        def update(snapshot):
+            if result_code != 'done':
+                return {}
+            bookmark = {
+                'href': url,
+                'description': title,
+                'extended': description,
+                'tags': ' '.join(tags or []),
+                'time': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+            }
+            # Keep the full bookmark list (posts/all is rate-limited to once every
+            # 5 minutes) and only drop the entries the new bookmark makes stale
+            cache = {
+                key: value for key, value in snapshot.cache.items()
+                if key == 'bookmarks_' or not key.startswith(('bookmarks_', 'recent_bookmarks_', 'tags'))
+            }
+            if 'bookmarks_' in cache:
+                cache['bookmarks_'] = [bookmark] + [b for b in cache['bookmarks_'] if b.get('href') != url]
+            tag_index = snapshot.tag_index.copy()
+            tag_index.add(url, tags or [])
+            url_index = snapshot.url_index.copy()
+            url_index.add(bookmark)
+            return {'cache': MappingProxyType(cache), 'tag_index': tag_index, 'url_index': url_index}
+
+        if result_code == 'done':
+            self._drop_persisted_bookmarks()
+        self._swap(update, error_message=None)
+        return result_code
+
+    def start_import(self, path):
+        """Start (or resume) importing a bookmark file in the background"""
+        if self.import_job and self.import_job.is_alive():
+            return self.import_job
+
+        self.get_bookmarks()  # Imports are de-duplicated against the URL index
+        self.import_job = ImportJob(self, path)
+        self.import_job.start()
+        return self.import_job
+
+    def export(self, path):
+        """Export all bookmarks to path and return how many were written"""
+        bookmarks = self.get_bookmarks()
+        if not bookmarks and self.error_message:
+            raise RuntimeError(self.error_message)
+        return export_bookmarks(bookmarks, path)
+
+
+class OfflinePinboardStore(PinboardStore):
+    """PinboardStore answering API reads from a local JSON or Netscape HTML export
+
+    Useful to run queries in bulk, or to profile them, without network access.
+    """
+
+    def __init__(self, path, preferences=None, logger=None, usage_log_path=USAGE_LOG_PATH):
+        super().__init__(preferences, logger, usage_log_path)
+        with open(path, encoding='utf-8', errors='replace') as export_file:
+            self.bookmarks = list(iter_bookmark_file(export_file, path))
+
+    def get_token(self):
+        return 'offline'
+
+    def api_get(self, method, **params):
+        if method == 'posts/all':
+            tag = params.get('tag')
+            return [b for b in self.bookmarks if not tag or tag in b.get('tags', '').split()]
+        if method == 'posts/recent':
+            bookmarks = sorted(self.bookmarks, key=lambda x: x.get('time', ''), reverse=True)
+            return {'posts': bookmarks[:int(params.get('count', 15))]}
+        if method == 'tags/get':
+            counts = {}
+            for bookmark in self.bookmarks:
+                for tag in TagIndex.split_tags(bookmark.get('tags', '')):
+                    counts[tag] = counts.get(tag, 0) + 1
+            return counts
+        raise RuntimeError(f"{method} is not available offline")
+
+
+def _print_json(result):
+    json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write('\n')
+
+
+def main(argv=None):
+    """Command line entry point; every command prints JSON to stdout"""
+    parser = argparse.ArgumentParser(description='Query your Pinboard bookmarks')
+    parser.add_argument('--token', default=os.environ.get('PINBOARD_TOKEN', ''),
+                        help='Pinboard API token (username:TOKEN), defaults to $PINBOARD_TOKEN')
+    parser.add_argument('--offline', metavar='FILE',
+                        help='Read bookmarks from a JSON or HTML export instead of the API')
+    parser.add_argument('--sort', choices=['time', 'title', 'frecency'], default='time',
+                        help='How to sort bookmarks')
+    parser.add_argument('--sort-tags', choices=['count', 'alpha'], default='count',
+                        help='How to sort tags')
+    parser.add_argument('--limit', type=int, default=0, help='Maximum number of results (0 for all)')
+    parser.add_argument('--cache-time', type=int, default=5, metavar='MINUTES',
+                        help='How long the bookmark list fetched by one run is reused by the next ones')
+    parser.add_argument('--verbose', action='store_true', help='Log to stderr')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search_parser = commands.add_parser('search', help='Search bookmarks')
+    search_parser.add_argument('query', nargs='*', help='Text to look for in title, description or URL')
+    search_parser.add_argument('--tag', action='append', default=[], help='Only search bookmarks with this tag; repeat to require several')
+    search_parser.add_argument('--batch', metavar='FILE',
+                               help="Run one query per line of FILE ('-' for stdin), printing one JSON line each")
+
+    tags_parser = commands.add_parser('tags', help='List tags')
+    tags_parser.add_argument('--selected', action='append', default=[],
+                             help='Only list tags that co-occur with this tag')
+
+    recent_parser = commands.add_parser('recent', help='List recent bookmarks')
+    recent_parser.add_argument('query', nargs='*', help='Text to filter recent bookmarks by')
+    recent_parser.add_argument('--count', type=int, default=20, help='Number of recent bookmarks to fetch')
+
+    commands.add_parser('sync', help='Fetch bookmarks and tags, ignoring cached data')
+    commands.add_parser('stats', help='Show sizes of the loaded data and indexes')
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    preferences = {'pinboard_token': args.token, 'sort_bookmarks': args.sort, 'sort_tags': args.sort_tags,
+                   'cache_time': str(args.cache_time)}
+    if args.offline:
+        store = OfflinePinboardStore(args.offline, preferences)
+    else:
+        store = PinboardStore(preferences, persist_bookmarks=True)
+        if not args.token:
+            parser.error('a Pinboard API token is required (--token or $PINBOARD_TOKEN)')
+
+    def limited(results):
+        return results[:args.limit] if args.limit else results
+
+    if args.command == 'search' and args.batch:
+        batch_file = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+        with batch_file:
+            for line in batch_file:
+                query = line.strip()
+                sys.stdout.write(json.dumps({'query': query, 'results': limited(store.search(query, args.tag))},
+                                            ensure_ascii=False) + '\n')
+    elif args.command == 'search':
+        _print_json(limited(store.search(' '.join(args.query), args.tag)))
+    elif args.command == 'tags':
+        _print_json(limited(store.get_selection_tags(args.selected)))
+    elif args.command == 'recent':
+        _print_json(limited(store.recent(' '.join(args.query), args.count)))
+    elif args.command == 'sync':
+        _print_json(store.sync())
+    elif args.command == 'stats':
+        _print_json(store.stats())
+
+    return 1 if store.error_message else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('ulauncher')
+
+from main import ViewEngine  # noqa: E402
+from pinboard_core import PinboardStore  # noqa: E402
+
+BOOKMARKS = [
+    {'href': 'https://a.com/1', 'description': 'A1', 'extended': '', 'tags': 'py web',
+     'time': '2024-01-01T00:00:00Z'},
+    {'href': 'https://a.com/2', 'description': 'A2', 'extended': '', 'tags': 'py',
+     'time': '2024-01-02T00:00:00Z'},
+    {'href': 'https://b.com/', 'description': 'B', 'extended': '', 'tags': 'web js',
+     'time': '2024-01-03T00:00:00Z'},
+]
+
+
+class StubStore(PinboardStore):
+    """Store answering from BOOKMARKS, or failing every request when offline"""
+
+    def __init__(self, preferences, usage_log_path, offline=False):
+        super().__init__(preferences, usage_log_path=usage_log_path)
+        self.offline = offline
+        self.calls = []
+
+    def api_get(self, method, **params):
+        self.calls.append(method)
+        if self.offline:
+            raise OSError('Network is unreachable')
+        if method == 'tags/get':
+            return {'py': 2, 'web': 2, 'js': 1}
+        if method == 'posts/recent':
+            return {'posts': BOOKMARKS}
+        return BOOKMARKS
+
+
+@pytest.fixture
+def make_views(tmp_path):
+    def make_views(offline=False):
+        preferences = {'pinboard_token': 'user:token', 'max_results': '50', 'sort_bookmarks': 'time',
+                       'sort_tags': 'count', 'recent_count': '20', 'cache_time': '5'}
+        store = StubStore(preferences, str(tmp_path / 'usage.log'), offline)
+        extension = SimpleNamespace(store=store, preferences=preferences, logger=logging.getLogger(__name__))
+        return ViewEngine(extension)
+    return make_views
+
+
+def hits_and_misses(views):
+    return {stage: stats[:2] for stage, stats in views.stats.items()}
+
+
+def test_rendering_a_view_again_reuses_every_stage(make_views):
+    views = make_views()
+    first = views.bookmark_items('a', ('py',))
+    assert views.bookmark_items('a', ('py',)) is first
+    assert hits_and_misses(views) == {
+        'bookmarks.filter': [1, 1], 'bookmarks.rank': [1, 1], 'bookmarks.limit': [1, 1], 'bookmarks.render': [1, 1]
+    }
+    assert views.extension.store.calls == ['posts/all']
+
+
+def test_tag_stages_ignore_selection_order_and_share_the_narrowing(make_views):
+    views = make_views()
+    views.tag_items(('py', 'web'))
+    views.tag_items(('web', 'py'))
+    views.tag_items(('web', 'py'), 'p')
+    assert hits_and_misses(views) == {
+        'tags.narrow': [2, 1], 'tags.filter': [1, 2], 'tags.rank': [1, 2], 'tags.render': [1, 2]
+    }
+
+
+def test_ranking_changes_with_the_sort_preference_only(make_views):
+    views = make_views()
+    by_time = views.bookmark_items('a')
+    views.extension.preferences['sort_bookmarks'] = 'title'
+    by_title = views.bookmark_items('a')
+    assert by_title is not by_time
+    assert views.stats['bookmarks.filter'][:2] == [1, 1]
+    assert views.stats['bookmarks.rank'][:2] == [0, 2]
+
+
+def test_failing_fetches_are_sent_once_per_render(make_views):
+    views = make_views(offline=True)
+    views.tag_items(('py',))
+    assert views.extension.store.calls == ['tags/get', 'posts/all']
+    views.bookmark_items('a', ('py',))
+    assert views.extension.store.calls == ['tags/get', 'posts/all', 'posts/all']
@@ -0,0 +1,331 @@
+import io
+import json
+import os
+import time
+import urllib.error
+
+import pytest
+
+import pinboard_core
+from pinboard_core import (
+    OfflinePinboardStore, PinboardStore, TagIndex, UrlIndex, UsageLog, export_bookmarks,
+    iter_bookmark_file, normalize_url
+)
+
+BOOKMARKS = [
+    {'href': 'https://a.com/1', 'description': 'A1', 'extended': '', 'tags': 'py web',
+     'time': '2024-01-01T00:00:00Z'},
+    {'href': 'https://a.com/2', 'description': 'A2', 'extended': 'notes', 'tags': 'py',
+     'time': '2024-01-02T00:00:00Z'},
+    {'href': 'https://b.com/', 'description': 'B', 'extended': '', 'tags': 'web js',
+     'time': '2024-01-03T00:00:00Z'},
+]
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://Example.COM/path/', 'example.com/path'),
+    ('http://example.com:80/a?utm_source=x&id=3', 'example.com/a?id=3'),
+    ('https://example.com:443/a?fbclid=1#top', 'example.com/a#top'),
+    ('example.com/a/', 'example.com/a'),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+
+
+def test_split_tags_keeps_first_occurrence_order():
+    assert TagIndex.split_tags('b a  b') == ('b', 'a')
+    assert TagIndex.split_tags(['x', '', 'x', 'y']) == ('x', 'y')
+
+
+def test_tag_index_related_and_intersection():
+    index = TagIndex()
+    index.sync(BOOKMARKS)
+    assert index.related(['py']) == {'web': 1}
+    assert index.related(['web']) == {'py': 1, 'js': 1}
+    assert index.related(['py', 'web']) == {}
+    assert index.related(['unknown']) == {}
+    assert index.hrefs_with_all(['py']) == {'https://a.com/1', 'https://a.com/2'}
+    assert index.hrefs_with_all(['py', 'web']) == {'https://a.com/1'}
+    assert index.hrefs_with_all(['py', 'unknown']) == set()
+
+
+def test_tag_index_remove_and_retag():
+    index = TagIndex()
+    index.sync(BOOKMARKS)
+    index.add('https://a.com/1', 'py')
+    assert index.related(['py']) == {}
+    index.remove('https://b.com/')
+    assert index.hrefs_with_all(['js']) == set()
+    assert index.related(['web']) == {}
+
+
+def test_tag_index_synced_returns_self_when_unchanged():
+    index = TagIndex().synced(BOOKMARKS)
+    assert index.synced([dict(bookmark) for bookmark in BOOKMARKS]) is index
+    retagged = index.synced(BOOKMARKS[:2] + [dict(BOOKMARKS[2], tags='js')])
+    assert retagged is not index
+    assert index.related(['web']) == {'py': 1, 'js': 1}  # The original is left untouched
+    assert retagged.related(['web']) == {'py': 1}
+
+
+def test_tag_index_synced_detects_swap_to_new_tag():
+    index = TagIndex().synced([{'href': 'x', 'tags': 'a'}])
+    swapped = index.synced([{'href': 'y', 'tags': 'brandnew'}])
+    assert swapped is not index
+    assert swapped.hrefs_with_all(['brandnew']) == {'y'}
+    assert swapped.hrefs_with_all(['a']) == set()
+
+
+def test_url_index_duplicates():
+    index = UrlIndex()
+    index.sync(BOOKMARKS + [{'href': 'http://b.com?utm_medium=mail', 'description': 'B again'}])
+    assert 'https://B.com' in index
+    assert [len(group) for group in index.duplicates()] == [2]
+    index.remove('http://b.com?utm_medium=mail')
+    assert index.duplicates() == []
+
+
+def test_import_json_coerces_null_fields():
+    export = io.StringIO(json.dumps([
+        {'href': 'http://a', 'tags': None, 'extended': None, 'time': None},
+        {'url': 'http://b', 'title': 'B', 'tags': ['x', None, 'y']},
+        'not a bookmark',
+    ]))
+    bookmarks = list(iter_bookmark_file(export, 'export.json'))
+    assert bookmarks == [
+        {'href': 'http://a', 'description': 'http://a', 'extended': '', 'tags': '', 'time': ''},
+        {'href': 'http://b', 'description': 'B', 'extended': '', 'tags': 'x y', 'time': ''},
+    ]
+
+
+NETSCAPE_EXPORT = """<!DOCTYPE NETSCAPE-Bookmark-file-1>
+<DL><p>
+<DT><A HREF="https://a.com/" ADD_DATE="1704067200" TAGS="py,web">A  site</A>
+<DD>x, y and z
+<DT><A HREF="https://b.com/" ADD_DATE>B</A>
+<DT><A HREF>No URL</A>
+</DL><p>
+"""
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, pinboard_core.IMPORT_CHUNK_SIZE])
+def test_netscape_import_is_independent_of_chunk_size(chunk_size):
+    bookmarks = list(pinboard_core.iter_netscape_bookmarks(io.StringIO(NETSCAPE_EXPORT), chunk_size))
+    assert bookmarks == [
+        {'href': 'https://a.com/', 'description': 'A  site', 'extended': 'x, y and z', 'tags': 'py web',
+         'time': '2024-01-01T00:00:00Z'},
+        {'href': 'https://b.com/', 'description': 'B', 'extended': '', 'tags': '', 'time': ''},
+        {'href': '', 'description': 'No URL', 'extended': '', 'tags': '', 'time': ''},
+    ]
+
+
+@pytest.mark.parametrize('name', ['bookmarks.html', 'bookmarks.json'])
+def test_export_round_trip(tmp_path, name):
+    path = str(tmp_path / name)
+    assert export_bookmarks(BOOKMARKS, path) == len(BOOKMARKS)
+    with open(path, encoding='utf-8') as export_file:
+        assert list(iter_bookmark_file(export_file, path)) == BOOKMARKS
+
+
+def test_usage_log_scores_decay_and_survive_reload(tmp_path):
+    path = str(tmp_path / 'usage.log')
+    log = UsageLog(path)
+    now = time.time()
+    log.record('https://a.com/1', timestamp=now - 30 * 86400)
+    log.record('https://a.com/2', timestamp=now)
+    assert log.score('https://a.com/1', now) == pytest.approx(0.5)
+    assert log.score('https://a.com/2', now) == pytest.approx(1.0)
+    assert UsageLog(path).score('https://a.com/1', now) == pytest.approx(0.5)
+
+
+def test_offline_store_search_and_selection_tags(tmp_path):
+    path = tmp_path / 'export.json'
+    path.write_text(json.dumps(BOOKMARKS))
+    store = OfflinePinboardStore(str(path), usage_log_path=str(tmp_path / 'usage.log'))
+    assert [b['href'] for b in store.search('', ['py', 'web'])] == ['https://a.com/1']
+    assert [b['href'] for b in store.search('notes')] == ['https://a.com/2']
+    assert store.get_selection_tags(['py']) == [{'name': 'py', 'count': 2}, {'name': 'web', 'count': 1}]
+
+
+class CountingStore(PinboardStore):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    def api_get(self, method, **params):
+        self.calls.append(method)
+        if method == 'posts/add':
+            return {'result_code': 'done'}
+        if method == 'tags/get':
+            return {'py': 2, 'web': 2, 'js': 1}
+        if method == 'posts/recent':
+            return {'posts': [dict(bookmark) for bookmark in BOOKMARKS]}
+        return [dict(bookmark) for bookmark in BOOKMARKS]
+
+
+def test_persisted_bookmarks_are_shared_between_stores(tmp_path, monkeypatch):
+    monkeypatch.setattr(pinboard_core, 'DATA_DIR', str(tmp_path))
+    preferences = {'pinboard_token': 'user:token', 'cache_time': '5'}
+    usage_log_path = str(tmp_path / 'usage.log')
+
+    first = CountingStore(preferences, usage_log_path=usage_log_path, persist_bookmarks=True)
+    second = CountingStore(preferences, usage_log_path=usage_log_path, persist_bookmarks=True)
+    assert first.get_bookmarks() == BOOKMARKS
+    assert second.get_bookmarks() == BOOKMARKS
+    assert (first.calls, second.calls) == (['posts/all'], [])
+
+    second.invalidate()  # e.g. sync: the next store fetches again
+    third = CountingStore(preferences, usage_log_path=usage_log_path, persist_bookmarks=True)
+    third.get_bookmarks()
+    assert third.calls == ['posts/all']
+
+
+def test_persisted_bookmarks_expire(tmp_path, monkeypatch):
+    monkeypatch.setattr(pinboard_core, 'DATA_DIR', str(tmp_path))
+    preferences = {'pinboard_token': 'user:token', 'cache_time': '1'}
+    usage_log_path = str(tmp_path / 'usage.log')
+
+    CountingStore(preferences, usage_log_path=usage_log_path, persist_bookmarks=True).get_bookmarks()
+    (persisted,) = [path for path in tmp_path.iterdir() if path.name.startswith('bookmarks-')]
+    expired = time.time() - 61
+    os.utime(persisted, (expired, expired))
+
+    store = CountingStore(preferences, usage_log_path=usage_log_path, persist_bookmarks=True)
+    store.get_bookmarks()
+    assert store.calls == ['posts/all']
+
+
+def test_add_bookmark_updates_cached_bookmarks_without_refetching(tmp_path):
+    store = CountingStore({'pinboard_token': 'user:token'}, usage_log_path=str(tmp_path / 'usage.log'))
+    store.get_bookmarks()
+    store.get_tags()
+    assert store.add_bookmark('https://new.com', 'New', tags=['py', 'new']) == 'done'
+
+    assert store.get_bookmarks()[0]['href'] == 'https://new.com'
+    assert len(store.get_bookmarks()) == len(BOOKMARKS) + 1
+    assert store.tag_index.hrefs_with_all(['py', 'new']) == {'https://new.com'}
+    assert 'https://new.com' in store.url_index
+    store.get_tags()  # Tag counts changed, so they are fetched again
+    assert store.calls == ['posts/all', 'tags/get', 'posts/add', 'tags/get']
+
+
+class ImportStore(PinboardStore):
+    """Store whose posts/add answers 429 once for each URL in rate_limited"""
+
+    def __init__(self, tmp_path, saved=(), rate_limited=(), stop_after=None):
+        super().__init__({'pinboard_token': 'user:token'}, usage_log_path=str(tmp_path / 'usage.log'))
+        self.saved = list(saved)
+        self.rate_limited = set(rate_limited)
+        self.stop_after = stop_after
+        self.posted = []
+        self.tokens = []
+
+    def api_get(self, method, **params):
+        if method == 'posts/add':
+            if params['url'] in self.rate_limited:
+                self.rate_limited.discard(params['url'])
+                raise urllib.error.HTTPError(params['url'], 429, 'Too Many Requests', {}, None)
+            self.posted.append(params['url'])
+            self.tokens.append(params.get('auth_token'))
+            if len(self.posted) == self.stop_after:
+                self.import_job.stop()
+            return {'result_code': 'done'}
+        return [dict(bookmark) for bookmark in self.saved]
+
+
+def test_import_job_skips_saved_and_repeated_urls_and_resumes(tmp_path, monkeypatch):
+    monkeypatch.setattr(pinboard_core, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(pinboard_core, 'IMPORT_RATE_LIMIT_SECONDS', 0)
+    path = tmp_path / 'import.json'
+    path.write_text(json.dumps([
+        {'href': 'https://a.com/1'},  # Already saved
+        {'href': 'https://new.com/1'},  # Rate limited once, then saved
+        {'href': 'https://new.com/2'},  # The first run is stopped after this one
+        {'href': 'http://new.com/1/?utm_source=feed'},  # Repeats the second entry
+        {'href': 'https://new.com/3'},
+    ]))
+
+    store = ImportStore(tmp_path, saved=BOOKMARKS, rate_limited={'https://new.com/1'}, stop_after=2)
+    job = store.start_import(str(path))
+    job.join(5)
+    assert store.posted == ['https://new.com/1', 'https://new.com/2']
+    assert not job.done
+    assert (job.processed, job.added, job.skipped, job.failed) == (3, 2, 1, 0)
+    assert os.path.exists(job.state_path)
+
+    store.stop_after = None
+    job = store.start_import(str(path))
+    job.join(5)
+    assert store.posted == ['https://new.com/1', 'https://new.com/2', 'https://new.com/3']
+    assert job.done and job.error_message is None
+    assert (job.added, job.skipped, job.failed) == (3, 2, 0)
+    assert not os.path.exists(job.state_path)
+
+
+class FakeResponse(io.BytesIO):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def fake_pinboard(calls, latency):
+    """urlopen stand-in answering the read-only API methods after some latency"""
+    answers = {
+        'posts/all': BOOKMARKS,
+        'tags/get': {'py': 2, 'web': 2, 'js': 1},
+        'posts/recent': {'posts': BOOKMARKS},
+    }
+
+    def urlopen(url, timeout=None):
+        method = url.split('/v1/', 1)[1].split('?', 1)[0]
+        calls.append((method, time.monotonic()))
+        time.sleep(latency)
+        return FakeResponse(json.dumps(answers[method]).encode('utf-8'))
+    return urlopen
+
+
+def test_warm_up_is_shared_with_views_and_spaces_requests(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(pinboard_core.urllib.request, 'urlopen', fake_pinboard(calls, latency=0.1))
+    monkeypatch.setattr(pinboard_core, 'API_MIN_INTERVAL_SECONDS', 0.05)
+    store = PinboardStore({'pinboard_token': 'user:token', 'recent_count': '20'},
+                          usage_log_path=str(tmp_path / 'usage.log'))
+
+    thread = store.warm_up()
+    time.sleep(0.02)  # Views opened while the warm-up is fetching
+    assert store.get_tags() == [{'name': 'py', 'count': 2}, {'name': 'web', 'count': 2}, {'name': 'js', 'count': 1}]
+    assert store.get_bookmarks() == BOOKMARKS
+    thread.join(5)
+
+    assert sorted(method for method, _ in calls) == ['posts/all', 'posts/recent', 'tags/get']
+    starts = sorted(started for _, started in calls)
+    assert all(later - earlier >= 0.045 for earlier, later in zip(starts, starts[1:]))
+    assert store.get_recent_bookmarks(20) == BOOKMARKS
+    assert len(calls) == 3
+
+
+def test_api_requests_are_spaced_outside_the_warm_up(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(pinboard_core.urllib.request, 'urlopen', fake_pinboard(calls, latency=0))
+    monkeypatch.setattr(pinboard_core, 'API_MIN_INTERVAL_SECONDS', 0.05)
+    store = PinboardStore({'pinboard_token': 'user:token'}, usage_log_path=str(tmp_path / 'usage.log'))
+
+    store.get_tags()
+    store.get_bookmarks()
+    assert [method for method, _ in calls] == ['tags/get', 'posts/all']
+    assert calls[1][1] - calls[0][1] >= 0.045
+
+
+def test_import_job_keeps_uploading_to_the_account_it_started_for(tmp_path, monkeypatch):
+    monkeypatch.setattr(pinboard_core, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(pinboard_core, 'IMPORT_RATE_LIMIT_SECONDS', 0)
+    path = tmp_path / 'import.json'
+    path.write_text(json.dumps([{'href': 'https://new.com/1'}, {'href': 'https://new.com/2'}]))
+
+    store = ImportStore(tmp_path)
+    job = pinboard_core.ImportJob(store, str(path))
+    store.preferences['pinboard_token'] = 'other:token'
+    job.run()
+    assert store.tokens == ['user:token', 'user:token']